@@ -0,0 +1,269 @@
+import argparse
+import json
+import logging
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import combine_labels
+import combine_workflows
+import decomposer
+import generate_fixtures
+import metrics
+import parse_package
+import separate_labels
+import separate_workflows
+import xml_backend
+
+SCRIPT_DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+
+# Operations in the order they run on a copy of the source, each one in a fresh process
+OPERATIONS = {
+    'combine_labels': lambda paths: combine_labels.combine_labels(paths['labels'], paths['label_file'], False, None),
+    'combine_workflows': lambda paths: combine_workflows.combine_workflows(paths['workflows'], False, None),
+    'separate_labels': lambda paths: separate_labels.separate_labels(paths['label_file']),
+    'separate_workflows': lambda paths: separate_workflows.separate_workflows(paths['workflows']),
+    'parse_package': lambda paths: parse_package.scan_package_metadata(paths['manifest'], paths['labels'],
+                                                                       paths['label_file'], paths['workflows']),
+    'parse_package_zip': lambda paths: parse_package.scan_package_metadata(
+        paths['manifest'], paths['labels'], paths['label_file'], paths['workflows'],
+        source_directory=paths['source'], zip_output=paths['deploy_zip']),
+}
+METRICS = ['wall_seconds', 'peak_rss_kb']
+
+
+def remove_separated_labels(paths):
+    """Delete the separated label files, so every label is written again."""
+    for filename in os.listdir(paths['labels']):
+        file_path = os.path.join(paths['labels'], filename)
+        if file_path != paths['label_file'] and filename.endswith('.xml'):
+            os.remove(file_path)
+
+
+def remove_separated_workflows(paths):
+    """Delete the separated workflow folders, so every workflow element is written again."""
+    for entry in os.listdir(paths['workflows']):
+        if os.path.isdir(os.path.join(paths['workflows'], entry)):
+            shutil.rmtree(os.path.join(paths['workflows'], entry))
+
+
+# The separated files are identical to the combined files after the combine operations, so they are deleted
+# before the separate operations, outside of the measured process
+PREPARE_OPERATIONS = {
+    'separate_labels': remove_separated_labels,
+    'separate_workflows': remove_separated_workflows,
+}
+
+
+def parse_args():
+    """Function to parse command line arguments."""
+    parser = argparse.ArgumentParser(description='A script to benchmark the separate and combine scripts.')
+    parser.add_argument('-s', '--source', default=None,
+                        help='Directory with the labels and workflows folders to benchmark. '
+                             'A synthetic org is generated if omitted.')
+    parser.add_argument('-m', '--manifest', default=None,
+                        help='Package used to benchmark parse_package with a source directory.')
+    parser.add_argument('-l', '--labels', type=int, default=10000)
+    parser.add_argument('-w', '--objects', type=int, default=200)
+    parser.add_argument('-e', '--elements', type=int, default=20)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('-r', '--repeat', type=int, default=3)
+    parser.add_argument('-o', '--output', default=None, help='Save the results to this JSON file.')
+    parser.add_argument('-b', '--baseline', default=None, help='Compare the results with this JSON file.')
+    parser.add_argument('-t', '--threshold', type=float, default=0.2,
+                        help='Relative increase over the baseline reported as a regression.')
+    parser.add_argument('--compare-runner', default=False, action='store_true',
+                        help='Compare the separate scripts with the single process runner instead.')
+    parser.add_argument('-x', '--backend', default=None, choices=xml_backend.BACKENDS,
+                        help='XML backend to benchmark. lxml is used if it is installed when omitted.')
+    parser.add_argument('--measure', default=None, choices=list(OPERATIONS), help=argparse.SUPPRESS)
+    parser.add_argument('--work-directory', default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    return args
+
+
+def get_work_paths(work_directory):
+    """Return the paths of the copied labels, workflows and package in a work directory."""
+    return {
+        'source': work_directory,
+        'labels': os.path.join(work_directory, 'labels'),
+        'label_file': os.path.join(work_directory, 'labels', 'CustomLabels.labels-meta.xml'),
+        'workflows': os.path.join(work_directory, 'workflows'),
+        'manifest': os.path.join(work_directory, 'package.xml'),
+        'deploy_zip': os.path.join(work_directory, 'deploy.zip'),
+    }
+
+
+def copy_source(source_directory, work_directory, manifest=None):
+    """Copy the labels and workflows folders and the package into a work directory."""
+    paths = get_work_paths(work_directory)
+    for folder in ('labels', 'workflows'):
+        shutil.copytree(os.path.join(source_directory, folder), paths[folder])
+    if manifest:
+        shutil.copyfile(manifest, paths['manifest'])
+    return paths
+
+
+def snapshot(directory):
+    """Return the modification time of every file under a directory."""
+    mtimes = {}
+    for root, _, files in os.walk(directory):
+        for filename in files:
+            file_path = os.path.join(root, filename)
+            mtimes[file_path] = os.stat(file_path).st_mtime_ns
+    return mtimes
+
+
+def measure_operation(operation, work_directory):
+    """Run one operation in this process and print its wall time and peak RSS as JSON."""
+    with open(os.devnull, 'w', encoding='utf-8') as devnull:
+        logging.basicConfig(format='%(message)s', level=logging.INFO, stream=devnull)
+        start = time.perf_counter()
+        OPERATIONS[operation](get_work_paths(work_directory))
+        wall_seconds = time.perf_counter() - start
+    print(json.dumps({'wall_seconds': wall_seconds, 'peak_rss_kb': metrics.peak_rss_kb()}))
+
+
+def run_operation(operation, work_directory):
+    """Run one operation in a fresh process and return its metrics."""
+    if operation in PREPARE_OPERATIONS:
+        PREPARE_OPERATIONS[operation](get_work_paths(work_directory))
+    before = snapshot(work_directory)
+    result = subprocess.run([sys.executable, os.path.abspath(__file__), '--measure', operation,
+                             '--work-directory', work_directory],
+                            check=True, capture_output=True, text=True)
+    operation_metrics = json.loads(result.stdout)
+    after = snapshot(work_directory)
+    operation_metrics['files_written'] = sum(1 for path, mtime in after.items() if before.get(path) != mtime)
+    wall_seconds = operation_metrics['wall_seconds']
+    operation_metrics['files_per_second'] = operation_metrics['files_written'] / wall_seconds if wall_seconds else 0
+    return operation_metrics
+
+
+def run_benchmark(source_directory, manifest, repeat):
+    """Run every operation on fresh copies of the source and keep the best wall time of each one."""
+    operations = [operation for operation in OPERATIONS if manifest or not operation.startswith('parse_package')]
+    results = {}
+    for _ in range(repeat):
+        with tempfile.TemporaryDirectory() as work_directory:
+            copy_source(source_directory, work_directory, manifest)
+            for operation in operations:
+                operation_metrics = run_operation(operation, work_directory)
+                best = results.get(operation)
+                if best is None or operation_metrics['wall_seconds'] < best['wall_seconds']:
+                    results[operation] = operation_metrics
+    return results
+
+
+def compare_results(results, baseline, threshold):
+    """Return the regressions of the results compared to a baseline."""
+    regressions = []
+    for operation, result in results.items():
+        baseline_metrics = baseline.get('operations', {}).get(operation)
+        if not baseline_metrics:
+            continue
+        for metric in METRICS:
+            if baseline_metrics[metric] and result[metric] > baseline_metrics[metric] * (1 + threshold):
+                regressions.append(f'{operation} {metric}: {baseline_metrics[metric]:.3f} -> {result[metric]:.3f}')
+    return regressions
+
+
+def print_results(results):
+    """Print the metrics of every operation."""
+    print(f'{"operation":<20}{"wall (s)":>10}{"peak RSS (KB)":>15}{"files":>8}{"files/s":>10}')
+    for operation, result in results.items():
+        print(f'{operation:<20}{result["wall_seconds"]:>10.3f}{result["peak_rss_kb"]:>15}'
+              f'{result["files_written"]:>8}{result["files_per_second"]:>10.0f}')
+
+
+def run_scripts(paths):
+    """Run each step as a separate script, like a pipeline would."""
+    commands = [
+        ['combine_labels.py', '-d', paths['labels'], '-f', paths['label_file']],
+        ['combine_workflows.py', '-d', paths['workflows']],
+        ['separate_labels.py', '-f', paths['label_file']],
+        ['separate_workflows.py', '-d', paths['workflows']],
+    ]
+    for command in commands:
+        subprocess.run([sys.executable, os.path.join(SCRIPT_DIRECTORY, command[0])] + command[1:],
+                       check=True, stderr=subprocess.DEVNULL)
+
+
+def run_decomposer(paths):
+    """Run every step in this process."""
+    decomposer.compose(label_directory=paths['labels'], label_file=paths['label_file'],
+                       workflow_directory=paths['workflows'])
+    decomposer.decompose(label_file=paths['label_file'], workflow_directory=paths['workflows'])
+
+
+def time_run(runner, source_directory):
+    """Time a runner on a fresh copy of the source directory."""
+    with tempfile.TemporaryDirectory() as work_directory:
+        paths = copy_source(source_directory, work_directory)
+        start = time.perf_counter()
+        runner(paths)
+        return time.perf_counter() - start
+
+
+def compare_runner(source_directory, repeat):
+    """Compare the separate scripts with the single process runner."""
+    # Match the scripts, whose output is discarded, without writing the log to the terminal
+    with open(os.devnull, 'w', encoding='utf-8') as devnull:
+        logging.basicConfig(format='%(message)s', level=logging.INFO, stream=devnull, force=True)
+        scripts_time = min(time_run(run_scripts, source_directory) for _ in range(repeat))
+        decomposer_time = min(time_run(run_decomposer, source_directory) for _ in range(repeat))
+
+    print(f'Separate scripts: {scripts_time:.3f}s')
+    print(f'Single process:   {decomposer_time:.3f}s')
+    print(f'Speed-up:         {scripts_time / decomposer_time:.2f}x')
+
+
+def main(inputs):
+    """Main function."""
+    if inputs.measure:
+        measure_operation(inputs.measure, inputs.work_directory)
+        return
+
+    # The operations run in child processes, which select their backend from the environment
+    try:
+        backend = xml_backend.set_backend(inputs.backend)
+    except ImportError as error:
+        print(f'ERROR: {error}')
+        sys.exit(1)
+    os.environ[xml_backend.BACKEND_VARIABLE] = backend
+    print(f'XML backend: {backend}')
+
+    with tempfile.TemporaryDirectory() as fixture_directory:
+        source_directory, manifest = inputs.source, inputs.manifest
+        fixture = {'source': source_directory}
+        if source_directory is None:
+            source_directory = generate_fixtures.generate_org(fixture_directory, inputs.labels, inputs.objects,
+                                                              inputs.elements, seed=inputs.seed)
+            manifest = os.path.join(fixture_directory, 'manifest', 'package.xml')
+            fixture = {'labels': inputs.labels, 'objects': inputs.objects, 'elements': inputs.elements,
+                       'seed': inputs.seed}
+
+        if inputs.compare_runner:
+            compare_runner(source_directory, inputs.repeat)
+            return
+        results = run_benchmark(source_directory, manifest, inputs.repeat)
+
+    print_results(results)
+    if inputs.output:
+        with open(inputs.output, 'w', encoding='utf-8') as output_file:
+            json.dump({'fixture': fixture, 'backend': backend, 'operations': results}, output_file, indent=2,
+                      sort_keys=True)
+    if inputs.baseline:
+        with open(inputs.baseline, 'r', encoding='utf-8') as baseline_file:
+            regressions = compare_results(results, json.load(baseline_file), inputs.threshold)
+        for regression in regressions:
+            print(f'REGRESSION: {regression}')
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main(parse_args())
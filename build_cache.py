@@ -0,0 +1,50 @@
+"""Persistent cache of file fingerprints used by the incremental combine scripts."""
+import hashlib
+import json
+import os
+
+CACHE_VERSION = 1
+
+
+def load_cache(cache_file):
+    """Load the cache entries, returning an empty cache if the file is missing or outdated."""
+    try:
+        with open(cache_file, 'r', encoding='utf-8') as file:
+            cache = json.load(file)
+    except (FileNotFoundError, ValueError):
+        return {}
+    if not isinstance(cache, dict) or cache.get('version') != CACHE_VERSION:
+        return {}
+    return cache.get('entries', {})
+
+
+def save_cache(cache_file, entries):
+    """Save the cache entries, replacing the previous cache file atomically."""
+    temp_file = f'{cache_file}.tmp'
+    with open(temp_file, 'w', encoding='utf-8') as file:
+        json.dump({'version': CACHE_VERSION, 'entries': entries}, file, sort_keys=True)
+    os.replace(temp_file, cache_file)
+
+
+def hash_file(file_path):
+    """Return the SHA-256 digest of a file."""
+    with open(file_path, 'rb') as file:
+        return hashlib.sha256(file.read()).hexdigest()
+
+
+def fingerprint(file_path, previous=None):
+    """Return the [mtime_ns, size, sha256] fingerprint of a file.
+
+    The file is only hashed again if its mtime or size differ from the previous fingerprint.
+    """
+    stat = os.stat(file_path)
+    if previous and previous[0] == stat.st_mtime_ns and previous[1] == stat.st_size:
+        return previous
+    return [stat.st_mtime_ns, stat.st_size, hash_file(file_path)]
+
+
+def same_content(fingerprints, previous_fingerprints):
+    """Return True if both fingerprint dictionaries cover the same files with the same hashes."""
+    if fingerprints.keys() != previous_fingerprints.keys():
+        return False
+    return all(fingerprints[path][2] == previous_fingerprints[path][2] for path in fingerprints)
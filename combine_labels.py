@@ -1,10 +1,18 @@
 import argparse
+import hashlib
 import logging
 import os
-import xml.etree.ElementTree as ET
-from xml.dom import minidom
 
-logging.basicConfig(format='%(message)s', level=logging.DEBUG)
+import build_cache
+import component_index
+import metadata_engine
+import metadata_registry
+import metrics
+import xml_backend
+import xml_writer
+
+# Default size cap of the cached label fragments
+DEFAULT_CACHE_MAX_BYTES = 32 * 1024 * 1024
 
 
 def parse_args():
@@ -15,59 +23,154 @@ def parse_args():
     parser.add_argument('-d', '--directory', default='force-app/main/default/labels')
     parser.add_argument('-m', '--manifest', default=False, action='store_true')
     parser.add_argument('-l', '--labels')
+    parser.add_argument('-c', '--cache', default=None,
+                        help='Cache file of formatted labels used to only re-format changed labels.')
+    parser.add_argument('--cache-max-bytes', type=int, default=DEFAULT_CACHE_MAX_BYTES,
+                        help='Size cap of the formatted labels kept in the cache.')
+    parser.add_argument('-i', '--index', default=None,
+                        help='Component index used to find the labels of the manifest.')
+    metrics.add_arguments(parser)
     args = parser.parse_args()
     return args
 
 
-def read_individual_xmls(label_directory, manifest, package_labels):
-    """Read each XML file."""
-    individual_xmls = []
+def scan_individual_xmls(label_directory):
+    """Scan the label directory for the label name and path of each XML file."""
+    individual_paths = []
     for file_path in os.listdir(label_directory):
         # Get file name without meta extension
         file_name, _ = os.path.splitext(os.path.basename(file_path))
         file_name = file_name.split('.')[0]
-        if (not manifest or (manifest and file_name in package_labels)) and file_path.endswith('.xml') and not file_path.endswith('.labels-meta.xml'):
-            tree = ET.parse(os.path.join(label_directory, file_path))
-            root = tree.getroot()
-            individual_xmls.append(root)
-
-    return individual_xmls
-
-
-def merge_xml_content(individual_roots):
-    """Merge XMLs for all objects."""
-    combined_root = ET.Element('CustomLabels', xmlns="http://soap.sforce.com/2006/04/metadata")
-
-    for root in individual_roots:
-        child_element = ET.Element(root.tag)
-        combined_root.append(child_element)
-        child_element.extend(root)
-
-    return combined_root
-
-
-def format_and_write_xml(combined_root, label_file):
-    """Create the final XML."""
-    xml_header = '<?xml version="1.0" encoding="UTF-8"?>\n'
-    xml_str = ET.tostring(combined_root, encoding='utf-8').decode('utf-8')
-    formatted_xml = minidom.parseString(xml_str).toprettyxml(indent="    ")
-
-    # Remove extra new lines
-    formatted_xml = '\n'.join(line for line in formatted_xml.split('\n') if line.strip())
-
-    # Remove existing XML declaration
-    formatted_xml = '\n'.join(line for line in formatted_xml.split('\n') if not line.strip().startswith('<?xml'))
-
-    with open(label_file, 'wb') as file:
-        file.write(xml_header.encode('utf-8'))
-        file.write(formatted_xml.encode('utf-8'))
-
-
-def combine_labels(label_directory, label_file, manifest, package_labels):
-    """Combine the labels for deployments."""
-    individual_roots = read_individual_xmls(label_directory, manifest, package_labels)
-    combined_root = merge_xml_content(individual_roots)
-    format_and_write_xml(combined_root, label_file)
+        if file_path.endswith('.xml') and not file_path.endswith('.labels-meta.xml'):
+            individual_paths.append((file_name, os.path.join(label_directory, file_path)))
+    return individual_paths
+
+
+def find_indexed_xmls(label_directory, package_labels, index):
+    """Find the XML files of the labels in the package with the component index.
+
+    Labels that are not in the index, or whose indexed file was deleted, are looked up in the label directory.
+    """
+    individual_paths = []
+    for label_name in package_labels:
+        label_path = index.get_label_path(label_name)
+        if label_path and os.path.isfile(label_path):
+            individual_paths.append(label_path)
+        else:
+            logging.warning('WARNING: The label %s in the package is not in the component index or its file was '
+                            'deleted.', label_name)
+            individual_paths.extend(find_package_xmls(label_directory, [label_name]))
+    return individual_paths
+
+
+def find_package_xmls(label_directory, package_labels):
+    """Find the XML files of the labels in the package without listing the label directory."""
+    individual_paths = []
+    scanned_paths = None
+    for label_name in package_labels:
+        label_path = os.path.join(label_directory, f'{label_name}.label-meta.xml')
+        if os.path.isfile(label_path):
+            individual_paths.append(label_path)
+            continue
+        # Only scan the directory when a label is not in its default file
+        if scanned_paths is None:
+            scanned_paths = {}
+            for file_name, file_path in scan_individual_xmls(label_directory):
+                scanned_paths.setdefault(file_name, []).append(file_path)
+        if label_name in scanned_paths:
+            individual_paths.extend(scanned_paths[label_name])
+        else:
+            logging.warning('WARNING: The label %s in the package was not found in %s.', label_name, label_directory)
+    return individual_paths
+
+
+def find_individual_xmls(label_directory, manifest, package_labels, index=None):
+    """Find the XML file of each label."""
+    if manifest and index is not None:
+        return find_indexed_xmls(label_directory, package_labels, index)
+    if manifest:
+        return find_package_xmls(label_directory, package_labels)
+    return [file_path for _, file_path in scan_individual_xmls(label_directory)]
+
+
+def read_individual_xmls(label_directory, manifest, package_labels, index=None):
+    """Read each XML file, one file at a time."""
+    with metrics.phase('discovery'):
+        file_paths = find_individual_xmls(label_directory, manifest, package_labels, index)
+    for file_path in file_paths:
+        yield xml_backend.parse(file_path)
+
+
+def format_individual_xmls(label_directory, manifest, package_labels, index=None):
+    """Format each label as a fragment of the combined XML as it is read."""
+    return metadata_engine.format_individual_xmls(read_individual_xmls(label_directory, manifest, package_labels,
+                                                                       index))
+
+
+def format_label(label_content):
+    """Format a label file as a fragment of the combined XML."""
+    return metadata_engine.format_separated_file(xml_backend.fromstring(label_content))
+
+
+def evict_fragments(fragments, max_bytes):
+    """Keep the most recently used fragments that fit in the size cap."""
+    kept_fragments = {}
+    total_bytes = 0
+    for digest, (last_run, fragment) in sorted(fragments.items(), key=lambda item: item[1][0], reverse=True):
+        total_bytes += len(fragment)
+        if total_bytes > max_bytes:
+            break
+        kept_fragments[digest] = [last_run, fragment]
+    return kept_fragments
+
+
+def combine_cached_labels(label_paths, label_file, cache_file, max_bytes):
+    """Combine the labels, only formatting the labels missing from the fragment cache."""
+    cache = build_cache.load_cache(cache_file)
+    run = cache.get('run', 0) + 1
+    fragments = cache.get('fragments', {})
+    label_fragments = []
+    formatted = 0
+
+    for label_path in label_paths:
+        with metrics.phase('parse'):
+            with open(label_path, 'rb') as file:
+                label_content = file.read()
+            metrics.count('files_read')
+            metrics.count('bytes_read', len(label_content))
+            # Fragments are keyed by the content of the label file
+            digest = hashlib.sha256(label_content).hexdigest()
+        if digest in fragments:
+            fragment = fragments[digest][1]
+        else:
+            fragment = format_label(label_content)
+            formatted += 1
+        fragments[digest] = [run, fragment]
+        label_fragments.append(fragment)
+
+    xml_writer.write_xml_fragments_file(metadata_engine.create_combined_root(metadata_registry.LABELS), label_fragments,
+                                        label_file)
+    build_cache.save_cache(cache_file, {'run': run, 'fragments': evict_fragments(fragments, max_bytes)})
+
+    logging.info('Formatted %d changed label(s) and reused %d cached label(s).',
+                 formatted, len(label_fragments) - formatted)
+
+
+def combine_labels(label_directory, label_file, manifest, package_labels, cache_file=None,
+                   cache_max_bytes=DEFAULT_CACHE_MAX_BYTES, index=None):
+    """Combine the labels for deployments.
+
+    In manifest mode, labels are found with the ComponentIndex if one is given.
+    """
+    if cache_file:
+        with metrics.phase('discovery'):
+            label_paths = find_individual_xmls(label_directory, manifest, package_labels, index)
+        combine_cached_labels(label_paths, label_file, cache_file, cache_max_bytes)
+    else:
+        # Labels are formatted as they are read, so only one label is held in memory
+        fragments = format_individual_xmls(label_directory, manifest, package_labels, index)
+        xml_writer.write_xml_fragments_file(metadata_engine.create_combined_root(metadata_registry.LABELS), fragments,
+                                            label_file)
 
     if manifest:
         logging.info("The custom labels for %s have been compiled for deployments.",
@@ -76,12 +179,16 @@ def combine_labels(label_directory, label_file, manifest, package_labels):
         logging.info('The custom labels have been compiled for deployments.')
 
 
-def main(directory, label_file, manifest, labels):
+def main(directory, label_file, manifest, labels, cache_file, cache_max_bytes, index_file):
     """Main function."""
-    combine_labels(directory, label_file, manifest, labels)
+    package_labels = [label.strip() for label in labels.split(',')] if labels else []
+    index = component_index.ComponentIndex(index_file) if index_file else None
+    combine_labels(directory, label_file, manifest, package_labels, cache_file, cache_max_bytes, index)
 
 
 if __name__ == '__main__':
     inputs = parse_args()
+    metrics.configure_logging(inputs)
     main(inputs.directory, inputs.file,
-         inputs.manifest, inputs.labels)
+         inputs.manifest, inputs.labels, inputs.cache, inputs.cache_max_bytes, inputs.index)
+    metrics.report('combine_labels', inputs)
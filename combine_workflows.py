@@ -1,10 +1,13 @@
 import argparse
 import logging
 import os
-import xml.etree.ElementTree as ET
-from xml.dom import minidom
 
-logging.basicConfig(format='%(message)s', level=logging.DEBUG)
+import build_cache
+import component_index
+import metadata_engine
+import metadata_registry
+import metrics
+import xml_writer
 
 
 def parse_args():
@@ -13,77 +16,135 @@ def parse_args():
     parser.add_argument('-d', '--directory', default='force-app/main/default/workflows')
     parser.add_argument('-m', '--manifest', default=False, action='store_true')
     parser.add_argument('-w', '--workflows', default=None)
+    parser.add_argument('-c', '--cache', default=None,
+                        help='Cache file used to skip objects whose workflows have not changed.')
+    parser.add_argument('-i', '--index', default=None,
+                        help='Component index used to find the workflows of the manifest.')
+    metrics.add_arguments(parser)
     args = parser.parse_args()
     return args
 
 
-def read_individual_xmls(workflow_directory, manifest, package_workflows):
-    """Read each XML file."""
-    individual_xmls = {}
-
-    def process_workflow_file(filepath, parent_workflow_name):
-        tree = ET.parse(filepath)
-        root = tree.getroot()
-        individual_xmls.setdefault(parent_workflow_name, []).append(root)
-
-    for root, _, files in os.walk(workflow_directory):
-        for filename in files:
-            if filename.endswith('.xml') and not filename.endswith('.workflow-meta.xml'):
-                file_path = os.path.join(root, filename)
-                relative_path = os.path.relpath(file_path, workflow_directory)
-                parent_workflow_name = relative_path.split(os.path.sep)[0]
-                if not manifest or (manifest and parent_workflow_name in package_workflows):
-                    process_workflow_file(file_path, parent_workflow_name)
-
-    # Sort by workflow type and then alphabetically
-    sorted_individual_xmls = {k: sorted(v, key=lambda x: x.tag) for k, v in sorted(individual_xmls.items())}
-
-    return sorted_individual_xmls
-
-
-def merge_xml_content(individual_xmls):
-    """Merge XMLs for each object."""
-    merged_xmls = {}
-    for parent_workflow_name, individual_roots in individual_xmls.items():
-        parent_workflow_root = ET.Element('Workflow', xmlns="http://soap.sforce.com/2006/04/metadata")
-
-        # Sort individual_roots by tag to match Salesforce CLI output
-        individual_roots.sort(key=lambda x: x.tag)
-
-        for root in individual_roots:
-            child_element = ET.Element(root.tag)
-            parent_workflow_root.append(child_element)
-            child_element.extend(root)
-
-        merged_xmls[parent_workflow_name] = parent_workflow_root
-
-    return merged_xmls
-
-
-def format_and_write_xmls(merged_xmls, workflow_directory):
-    """Create the final XMLs."""
-    xml_header = '<?xml version="1.0" encoding="UTF-8"?>\n'
-    for parent_workflow_name, parent_workflow_root in merged_xmls.items():
-        parent_xml_str = ET.tostring(parent_workflow_root, encoding='utf-8').decode('utf-8')
-        formatted_xml = minidom.parseString(parent_xml_str).toprettyxml(indent="    ")
-
-        # Remove extra new lines
-        formatted_xml = '\n'.join(line for line in formatted_xml.split('\n') if line.strip())
-
-        # Remove existing XML declaration
-        formatted_xml = '\n'.join(line for line in formatted_xml.split('\n') if not line.strip().startswith('<?xml'))
-
-        parent_workflow_filename = os.path.join(workflow_directory, f'{parent_workflow_name}.workflow-meta.xml')
-        with open(parent_workflow_filename, 'wb') as file:
-            file.write(xml_header.encode('utf-8'))
-            file.write(formatted_xml.encode('utf-8'))
-
-
-def combine_workflows(workflow_directory, manifest, package_workflows):
-    """Combine the workflows for deployments."""
-    individual_xmls = read_individual_xmls(workflow_directory, manifest, package_workflows)
-    merged_xmls = merge_xml_content(individual_xmls)
-    format_and_write_xmls(merged_xmls, workflow_directory)
+def iter_individual_xmls(workflow_directory, manifest, package_workflows, index=None):
+    """Yield the name and the XML files of each object, one object at a time."""
+    if not manifest:
+        for entry in sorted(os.listdir(workflow_directory)):
+            entry_path = os.path.join(workflow_directory, entry)
+            if os.path.isdir(entry_path):
+                file_paths = metadata_engine.walk_separated_files(metadata_registry.WORKFLOWS, entry_path)
+                if file_paths:
+                    yield entry, file_paths
+            elif metadata_engine.is_separated_file(metadata_registry.WORKFLOWS, entry):
+                yield entry, [entry_path]
+        return
+
+    # Only descend into the folders of the objects in the package
+    for parent_workflow_name in sorted(package_workflows):
+        # Elements added or deleted since the object was indexed are found by listing its folder instead
+        if index is not None and index.is_current(parent_workflow_name):
+            file_paths = index.get_workflow_paths(parent_workflow_name)
+        else:
+            if index is not None:
+                logging.warning('WARNING: The component index is out of date for the workflows of %s.',
+                                parent_workflow_name)
+            object_directory = os.path.join(workflow_directory, parent_workflow_name)
+            file_paths = (metadata_engine.walk_separated_files(metadata_registry.WORKFLOWS, object_directory)
+                          if os.path.isdir(object_directory) else [])
+            if not os.path.isdir(object_directory):
+                logging.warning('WARNING: The workflows of %s in the package were not found in %s.',
+                                parent_workflow_name, workflow_directory)
+        if file_paths:
+            yield parent_workflow_name, file_paths
+
+
+def find_individual_xmls(workflow_directory, manifest, package_workflows, index=None):
+    """Find the XML files of each object."""
+    return dict(iter_individual_xmls(workflow_directory, manifest, package_workflows, index))
+
+
+def format_object_workflows(file_paths):
+    """Format the XML files of an object as fragments of its combined XML."""
+    return metadata_engine.format_individual_xmls(metadata_engine.parse_separated_files(file_paths))
+
+
+def get_workflow_filename(workflow_directory, parent_workflow_name):
+    """Return the path of the combined workflow file of an object."""
+    return os.path.join(workflow_directory, metadata_registry.WORKFLOWS.combined_filename(parent_workflow_name))
+
+
+def combine_object_workflows(workflow_directory, parent_workflow_name, file_paths):
+    """Parse, merge and write the workflows of one object, so only one object is held in memory."""
+    parent_workflow_root = metadata_engine.create_combined_root(metadata_registry.WORKFLOWS)
+    fragments = format_object_workflows(file_paths)
+    xml_writer.write_xml_fragments_file(parent_workflow_root, fragments,
+                                        get_workflow_filename(workflow_directory, parent_workflow_name))
+
+
+def fingerprint_sources(workflow_directory, file_paths, cached_sources):
+    """Fingerprint the XML files of an object, keyed by their path relative to the workflow directory."""
+    fingerprints = {}
+    with metrics.phase('cache'):
+        for file_path in file_paths:
+            relative_path = os.path.relpath(file_path, workflow_directory)
+            fingerprints[relative_path] = build_cache.fingerprint(file_path, cached_sources.get(relative_path))
+    return fingerprints
+
+
+def is_up_to_date(entry, sources, workflow_filename):
+    """Return True if the sources and the combined file of an object match the cache entry."""
+    if not entry or not build_cache.same_content(sources, entry['sources']):
+        return False
+    if not os.path.isfile(workflow_filename):
+        return False
+    return build_cache.fingerprint(workflow_filename, entry['output'])[2] == entry['output'][2]
+
+
+def combine_cached_workflows(workflow_directory, objects, manifest, cache_file):
+    """Combine only the objects whose sources or combined file changed since the last run.
+
+    Return the names of the rebuilt and of the skipped objects.
+    """
+    cache = build_cache.load_cache(cache_file)
+    # Objects without sources are dropped in full runs, manifest runs keep the other objects as-is
+    updated_cache = dict(cache) if manifest else {}
+    rebuilt = []
+    skipped = []
+
+    for parent_workflow_name, file_paths in objects:
+        entry = cache.get(parent_workflow_name)
+        sources = fingerprint_sources(workflow_directory, file_paths, entry['sources'] if entry else {})
+        workflow_filename = get_workflow_filename(workflow_directory, parent_workflow_name)
+        if is_up_to_date(entry, sources, workflow_filename):
+            # Keep the refreshed fingerprints so touched files are not hashed again
+            updated_cache[parent_workflow_name] = {'sources': sources,
+                                                   'output': build_cache.fingerprint(workflow_filename,
+                                                                                     entry['output'])}
+            skipped.append(parent_workflow_name)
+        else:
+            combine_object_workflows(workflow_directory, parent_workflow_name, file_paths)
+            updated_cache[parent_workflow_name] = {'sources': sources,
+                                                   'output': build_cache.fingerprint(workflow_filename)}
+            rebuilt.append(parent_workflow_name)
+    build_cache.save_cache(cache_file, updated_cache)
+
+    logging.info('Rebuilt %d workflow(s): %s', len(rebuilt), ', '.join(sorted(rebuilt)) or 'none')
+    logging.info('Skipped %d unchanged workflow(s).', len(skipped))
+    logging.debug('Unchanged workflows: %s', ', '.join(sorted(skipped)) or 'none')
+    return rebuilt, skipped
+
+
+def combine_workflows(workflow_directory, manifest, package_workflows, cache_file=None, index=None):
+    """Combine the workflows for deployments.
+
+    Objects are combined one at a time, so memory is bounded by the largest object instead of the whole org.
+    In manifest mode, workflow elements are found with the ComponentIndex if one is given.
+    """
+    objects = iter_individual_xmls(workflow_directory, manifest, package_workflows, index)
+    if cache_file:
+        combine_cached_workflows(workflow_directory, objects, manifest, cache_file)
+    else:
+        for parent_workflow_name, file_paths in objects:
+            combine_object_workflows(workflow_directory, parent_workflow_name, file_paths)
 
     if manifest:
         logging.info("The workflows for %s have been compiled for deployments.",
@@ -92,11 +153,15 @@ def combine_workflows(workflow_directory, manifest, package_workflows):
         logging.info('The workflows have been compiled for deployments.')
 
 
-def main(directory, manifest, package_workflows):
+def main(directory, manifest, package_workflows, cache_file, index_file):
     """Main function."""
-    combine_workflows(directory, manifest, package_workflows)
+    package_workflows = [workflow.strip() for workflow in package_workflows.split(',')] if package_workflows else []
+    index = component_index.ComponentIndex(index_file) if index_file else None
+    combine_workflows(directory, manifest, package_workflows, cache_file, index)
 
 
 if __name__ == '__main__':
     inputs = parse_args()
-    main(inputs.directory, inputs.manifest, inputs.workflows)
+    metrics.configure_logging(inputs)
+    main(inputs.directory, inputs.manifest, inputs.workflows, inputs.cache, inputs.index)
+    metrics.report('combine_workflows', inputs)
@@ -0,0 +1,275 @@
+import argparse
+import hashlib
+import json
+import logging
+import os
+
+import metadata_registry
+import metrics
+
+INDEX_VERSION = 2
+LABEL_TYPE = metadata_registry.LABELS.child_types['labels']
+WORKFLOW_TYPE = metadata_registry.WORKFLOWS.package_type
+# Package type of the elements in each workflow type folder
+WORKFLOW_CHILD_FOLDERS = metadata_registry.WORKFLOWS.child_types
+
+
+def parse_args():
+    """Function to parse command line arguments."""
+    parser = argparse.ArgumentParser(description='A script to build the index of the separated labels and workflows.')
+    parser.add_argument('-i', '--index', default='force-app/main/default/.component-index.json')
+    parser.add_argument('-l', '--label-directory', default='force-app/main/default/labels')
+    parser.add_argument('-d', '--workflow-directory', default='force-app/main/default/workflows')
+    metrics.add_arguments(parser)
+    args = parser.parse_args()
+    return args
+
+
+def describe_content(content):
+    """Return the size and SHA-256 digest of a file's content."""
+    return len(content), hashlib.sha256(content).hexdigest()
+
+
+class ComponentIndex:
+    """Index of every separated component by type and fullName, saved as JSON.
+
+    Entries hold the path relative to the index file, the size, the content hash and the parent object of
+    workflow elements. Workflow element fullNames include their object, like in a package.xml. The modification
+    times of the folders of each object are kept as well, so an element added or deleted since the object was
+    indexed is detected with a few stat calls.
+    """
+
+    def __init__(self, index_file):
+        self.index_file = index_file
+        self.root_directory = os.path.dirname(os.path.abspath(index_file))
+        self.components = {}
+        self.folders = {}
+        self.changed = False
+        self._parents = None
+        try:
+            with open(index_file, 'r', encoding='utf-8') as file:
+                index = json.load(file)
+            if index.get('version') == INDEX_VERSION:
+                self.components = index['components']
+                self.folders = index['folders']
+        except (FileNotFoundError, ValueError):
+            pass
+
+    def add(self, component_type, full_name, file_path, size, digest, parent=None):
+        """Add or update a component."""
+        entry = {'path': os.path.relpath(os.path.abspath(file_path), self.root_directory),
+                 'size': size, 'hash': digest}
+        if parent:
+            entry['parent'] = parent
+        members = self.components.setdefault(component_type, {})
+        if members.get(full_name) != entry:
+            members[full_name] = entry
+            self.changed = True
+            self._parents = None
+
+    def remove(self, component_type, full_name):
+        """Remove a component if it is in the index."""
+        if self.components.get(component_type, {}).pop(full_name, None) is not None:
+            self.changed = True
+            self._parents = None
+
+    def record_folders(self, parent_workflow_name, object_directory):
+        """Record the modification times of the folder of an object and of its type folders."""
+        folders = {}
+        if os.path.isdir(object_directory):
+            folder_paths = [object_directory] + [os.path.join(object_directory, entry)
+                                                 for entry in sorted(os.listdir(object_directory))]
+            for folder_path in folder_paths:
+                if os.path.isdir(folder_path):
+                    folders[os.path.relpath(os.path.abspath(folder_path), self.root_directory)] = \
+                        os.stat(folder_path).st_mtime_ns
+        if self.folders.get(parent_workflow_name, {}) != folders:
+            if folders:
+                self.folders[parent_workflow_name] = folders
+            else:
+                self.folders.pop(parent_workflow_name, None)
+            self.changed = True
+
+    def remove_workflow(self, parent_workflow_name):
+        """Remove the workflow elements and the folders of an object."""
+        for component_type in WORKFLOW_CHILD_FOLDERS.values():
+            members = self.components.get(component_type, {})
+            for full_name in [full_name for full_name, entry in members.items()
+                              if entry['parent'] == parent_workflow_name]:
+                self.remove(component_type, full_name)
+        if self.folders.pop(parent_workflow_name, None) is not None:
+            self.changed = True
+
+    def get_workflow_parents(self):
+        """Return the objects with indexed workflow elements or folders."""
+        parents = set(self.folders)
+        for component_type in WORKFLOW_CHILD_FOLDERS.values():
+            parents.update(entry['parent'] for entry in self.components.get(component_type, {}).values())
+        return parents
+
+    def get_path(self, component_type, full_name):
+        """Return the path of a component, or None if it is not in the index."""
+        entry = self.components.get(component_type, {}).get(full_name)
+        return os.path.join(self.root_directory, entry['path']) if entry else None
+
+    def get_label_path(self, label_name):
+        """Return the path of a label, or None if it is not in the index."""
+        return self.get_path(LABEL_TYPE, label_name)
+
+    def get_workflow_entries(self, parent_workflow_name):
+        """Return the sorted paths and sizes of the workflow elements of an object."""
+        if self._parents is None:
+            self._parents = {}
+            for component_type in WORKFLOW_CHILD_FOLDERS.values():
+                for entry in self.components.get(component_type, {}).values():
+                    self._parents.setdefault(entry['parent'], []).append(
+                        (os.path.join(self.root_directory, entry['path']), entry['size']))
+            for entries in self._parents.values():
+                entries.sort()
+        return self._parents.get(parent_workflow_name, [])
+
+    def get_workflow_paths(self, parent_workflow_name):
+        """Return the sorted paths of the workflow elements of an object."""
+        return [file_path for file_path, _ in self.get_workflow_entries(parent_workflow_name)]
+
+    def is_current(self, parent_workflow_name):
+        """Return True if the indexed workflow elements of an object still match the disk.
+
+        No file may have been added to or deleted from the folders of the object since they were recorded,
+        and every indexed file must still have its indexed size.
+        """
+        folders = self.folders.get(parent_workflow_name)
+        if not folders:
+            return False
+        with metrics.phase('discovery'):
+            try:
+                for folder_path, mtime in folders.items():
+                    if os.stat(os.path.join(self.root_directory, folder_path)).st_mtime_ns != mtime:
+                        return False
+                return all(os.stat(file_path).st_size == size
+                           for file_path, size in self.get_workflow_entries(parent_workflow_name))
+            except FileNotFoundError:
+                return False
+
+    def find_missing(self, manifest):
+        """Return the labels and workflows of a PackageManifest that are not in the index."""
+        missing = [f'{LABEL_TYPE}: {label}' for label in manifest.labels
+                   if label not in self.components.get(LABEL_TYPE, {})]
+        missing.extend(f'{WORKFLOW_TYPE}: {workflow}' for workflow in manifest.workflows
+                       if not self.get_workflow_paths(workflow))
+        return missing
+
+    def find_missing_files(self, manifest):
+        """Return the indexed labels and workflows of a PackageManifest whose files were deleted, with their paths.
+
+        A workflow is only missing if none of its elements are left, as a deleted element is combined without it.
+        """
+        missing = []
+        for label in manifest.labels:
+            label_path = self.get_label_path(label)
+            if label_path and not os.path.isfile(label_path):
+                missing.append((f'{LABEL_TYPE}: {label}', label_path))
+        for workflow in manifest.workflows:
+            file_paths = self.get_workflow_paths(workflow)
+            if not file_paths or self.is_current(workflow):
+                continue
+            object_directory = os.path.dirname(os.path.dirname(file_paths[0]))
+            if not any(filename.endswith('-meta.xml') for _, _, filenames in os.walk(object_directory)
+                       for filename in filenames):
+                missing.append((f'{WORKFLOW_TYPE}: {workflow}', object_directory))
+        return missing
+
+    def save(self):
+        """Save the index if it changed, replacing the previous index file atomically."""
+        if not self.changed:
+            return
+        temp_file = f'{self.index_file}.tmp'
+        with open(temp_file, 'w', encoding='utf-8') as file:
+            json.dump({'version': INDEX_VERSION, 'components': self.components, 'folders': self.folders}, file,
+                      sort_keys=True)
+        os.replace(temp_file, self.index_file)
+        self.changed = False
+
+
+class IndexUpdates:
+    """Index changes recorded by a worker process, applied to the ComponentIndex by the parent process."""
+
+    def __init__(self):
+        self.added = []
+        self.removed = []
+        self.folders = []
+
+    def add(self, *component):
+        """Record a component to add or update."""
+        self.added.append(component)
+
+    def remove(self, component_type, full_name):
+        """Record a component to remove."""
+        self.removed.append((component_type, full_name))
+
+    def record_folders(self, parent_workflow_name, object_directory):
+        """Record an object whose folders are recorded once its files are written."""
+        self.folders.append((parent_workflow_name, object_directory))
+
+    def apply(self, index):
+        """Apply the recorded changes to an index."""
+        for component in self.added:
+            index.add(*component)
+        for component_type, full_name in self.removed:
+            index.remove(component_type, full_name)
+        for parent_workflow_name, object_directory in self.folders:
+            index.record_folders(parent_workflow_name, object_directory)
+
+
+def add_file(index, component_type, full_name, file_path, parent=None):
+    """Add a component to the index from its file."""
+    with metrics.phase('parse'):
+        with open(file_path, 'rb') as file:
+            content = file.read()
+        metrics.count('files_read')
+        metrics.count('bytes_read', len(content))
+    index.add(component_type, full_name, file_path, *describe_content(content), parent)
+
+
+def build_index(index_file, label_directory, workflow_directory):
+    """Build the index from the separated labels and workflow elements."""
+    index = ComponentIndex(index_file)
+    index.components = {}
+    index.folders = {}
+    index.changed = True
+    if os.path.isdir(label_directory):
+        for filename in sorted(os.listdir(label_directory)):
+            if filename.endswith('.label-meta.xml'):
+                add_file(index, LABEL_TYPE, filename[:-len('.label-meta.xml')],
+                         os.path.join(label_directory, filename))
+    if os.path.isdir(workflow_directory):
+        for parent_workflow_name in sorted(os.listdir(workflow_directory)):
+            object_directory = os.path.join(workflow_directory, parent_workflow_name)
+            if not os.path.isdir(object_directory):
+                continue
+            for type_folder, component_type in WORKFLOW_CHILD_FOLDERS.items():
+                subfolder = os.path.join(object_directory, type_folder)
+                if not os.path.isdir(subfolder):
+                    continue
+                suffix = f'.{type_folder}-meta.xml'
+                for filename in sorted(os.listdir(subfolder)):
+                    if filename.endswith(suffix):
+                        add_file(index, component_type, f'{parent_workflow_name}.{filename[:-len(suffix)]}',
+                                 os.path.join(subfolder, filename), parent_workflow_name)
+            index.record_folders(parent_workflow_name, object_directory)
+    index.save()
+    logging.info('Indexed %d components in %s.', sum(len(members) for members in index.components.values()),
+                 index_file)
+    return index
+
+
+def main(index_file, label_directory, workflow_directory):
+    """Main function."""
+    build_index(index_file, label_directory, workflow_directory)
+
+
+if __name__ == '__main__':
+    inputs = parse_args()
+    metrics.configure_logging(inputs)
+    main(inputs.index, inputs.label_directory, inputs.workflow_directory)
+    metrics.report('component_index', inputs)
@@ -0,0 +1,120 @@
+import argparse
+
+import combine_labels
+import combine_workflows
+import metadata_engine
+import metadata_registry
+import metrics
+import parse_package
+import separate_labels
+import separate_workflows
+
+OPERATIONS = ['decompose', 'compose']
+METADATA_TYPES = ['labels', 'workflows']
+# Types without their own scripts, handled by the metadata engine
+ENGINE_TYPES = [name for name in metadata_registry.TYPES if name not in METADATA_TYPES]
+
+
+def parse_args():
+    """Function to parse command line arguments."""
+    parser = argparse.ArgumentParser(description='A script to separate and combine labels, workflows and the other '
+                                                 'registered metadata types in a single process.')
+    parser.add_argument('operations', nargs='+', choices=OPERATIONS,
+                        help='Operations to run in order.')
+    parser.add_argument('-t', '--types', nargs='+', choices=list(metadata_registry.TYPES),
+                        default=list(metadata_registry.TYPES))
+    parser.add_argument('--source', default=parse_package.SOURCE_DIRECTORY,
+                        help='Directory holding the folders of the other registered metadata types.')
+    parser.add_argument('-f', '--file', default=parse_package.LABEL_FILE)
+    parser.add_argument('-l', '--label-directory', default=parse_package.LABEL_DIRECTORY)
+    parser.add_argument('-d', '--workflow-directory', default=parse_package.WORKFLOW_DIRECTORY)
+    parser.add_argument('-m', '--manifest', nargs='+', default=None,
+                        help='Only combine the components declared in these packages.')
+    parser.add_argument('--destructive', nargs='+', default=None,
+                        help='Destructive packages checked against the manifest but never merged into it.')
+    parser.add_argument('-o', '--output', default=None,
+                        help='Write the merged and adjusted package to this file.')
+    parser.add_argument('-j', '--jobs', type=int, default=1)
+    parser.add_argument('-s', '--sync', default=False, action='store_true',
+                        help='Delete separated files that are no longer in the combined files.')
+    parser.add_argument('--prune-missing-objects', default=False, action='store_true',
+                        help='Also delete the separated files of objects without a combined file.')
+    parser.add_argument('--label-cache', default=None)
+    parser.add_argument('--workflow-cache', default=None)
+    parser.add_argument('-i', '--index', default=None,
+                        help='Component index updated when decomposing and used to find components when composing.')
+    metrics.add_arguments(parser)
+    args = parser.parse_args()
+    return args
+
+
+def decompose(types=METADATA_TYPES, label_file=parse_package.LABEL_FILE,
+              workflow_directory=parse_package.WORKFLOW_DIRECTORY, jobs=1, sync=False, index_file=None,
+              source_directory=parse_package.SOURCE_DIRECTORY, prune_missing_objects=False):
+    """Separate the labels, workflows and other registered types into their own files."""
+    if 'labels' in types:
+        separate_labels.separate_labels(label_file, sync, index_file)
+    if 'workflows' in types:
+        separate_workflows.separate_workflows(workflow_directory, jobs, sync, index_file, prune_missing_objects)
+    engine_types = [name for name in types if name in ENGINE_TYPES]
+    if engine_types:
+        metadata_engine.decompose(source_directory, engine_types, jobs, sync, prune_missing_objects)
+
+
+def compose(types=METADATA_TYPES, manifest=None, label_directory=parse_package.LABEL_DIRECTORY,
+            label_file=parse_package.LABEL_FILE, workflow_directory=parse_package.WORKFLOW_DIRECTORY,
+            label_cache=None, workflow_cache=None, package_output=None, index_file=None,
+            source_directory=parse_package.SOURCE_DIRECTORY, jobs=1, destructive_paths=None):
+    """Combine the labels, workflows and other registered types for deployments.
+
+    With one or more manifests, the packages are read once into a PackageManifest shared by the combine
+    steps and the package adjustment. With an index_file, the packages are validated against the component
+    index, which is then used to find the labels and workflows. The destructive packages are only checked
+    against the manifest.
+    """
+    if manifest is None:
+        if 'labels' in types:
+            combine_labels.combine_labels(label_directory, label_file, False, None, label_cache)
+        if 'workflows' in types:
+            combine_workflows.combine_workflows(workflow_directory, False, None, workflow_cache)
+        engine_types = [name for name in types if name in ENGINE_TYPES]
+        if engine_types:
+            metadata_engine.compose(source_directory, engine_types, jobs)
+        return
+
+    package_manifest = parse_package.read_package_metadata(manifest, source_directory)
+    index = parse_package.load_component_index(index_file, package_manifest) if index_file else None
+    if destructive_paths:
+        parse_package.check_destructive_changes(package_manifest, destructive_paths, workflow_directory,
+                                                source_directory)
+    if 'labels' in types and package_manifest.labels:
+        combine_labels.combine_labels(label_directory, label_file, True, package_manifest.labels, label_cache,
+                                      index=index)
+    if 'workflows' in types and package_manifest.workflows:
+        combine_workflows.combine_workflows(workflow_directory, True, package_manifest.workflows, workflow_cache,
+                                            index)
+    engine_components = parse_package.get_engine_components(package_manifest)
+    engine_types = [name for name in types if name in engine_components]
+    if engine_types:
+        metadata_engine.compose(source_directory, engine_types, jobs, engine_components)
+    parse_package.write_adjusted_package(package_manifest, manifest, package_output)
+
+
+def main(inputs):
+    """Main function."""
+    for operation in inputs.operations:
+        if operation == 'decompose':
+            decompose(inputs.types, inputs.file, inputs.workflow_directory, inputs.jobs, inputs.sync, inputs.index,
+                      inputs.source, inputs.prune_missing_objects)
+        else:
+            manifest = inputs.manifest[0] if inputs.manifest and len(inputs.manifest) == 1 else inputs.manifest
+            compose(inputs.types, manifest, inputs.label_directory, inputs.file,
+                    inputs.workflow_directory, inputs.label_cache, inputs.workflow_cache, inputs.output,
+                    inputs.index, inputs.source, inputs.jobs, inputs.destructive)
+
+
+if __name__ == '__main__':
+    inputs = parse_args()
+    metrics.configure_logging(inputs)
+    main(inputs)
+    metrics.report('decomposer', inputs)
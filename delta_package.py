@@ -0,0 +1,141 @@
+import argparse
+import logging
+import os
+import subprocess
+import sys
+
+import combine_labels
+import combine_workflows
+import component_index
+import metadata_engine
+import metadata_registry
+import metrics
+import parse_package
+
+
+def parse_args():
+    """Function to parse command line arguments."""
+    parser = argparse.ArgumentParser(description='A script to build the delta package.xml and combine the labels '
+                                                 'and workflows of the changed separated files.')
+    parser.add_argument('-g', '--git-ref', default=None,
+                        help='Read the changed paths from `git diff` against this ref instead of stdin.')
+    parser.add_argument('-o', '--output', default='./manifest/package.xml')
+    parser.add_argument('-a', '--api-version', default=None,
+                        help='API version of the delta package. The latest API version is used if omitted.')
+    parser.add_argument('-f', '--file', default=parse_package.LABEL_FILE)
+    parser.add_argument('-l', '--label-directory', default=parse_package.LABEL_DIRECTORY)
+    parser.add_argument('-d', '--workflow-directory', default=parse_package.WORKFLOW_DIRECTORY)
+    parser.add_argument('-i', '--index', default=None,
+                        help='Component index used to find the labels and workflows of the delta package.')
+    metrics.add_arguments(parser)
+    args = parser.parse_args()
+    return args
+
+
+def read_git_diff(git_ref):
+    """Return the paths changed since a git ref, relative to the current directory."""
+    # Without rename detection, a renamed file is listed as the deleted and the added path
+    command = ['git', 'diff', '--name-only', '--no-renames', '--relative', git_ref]
+    try:
+        result = subprocess.run(command, check=True, capture_output=True, text=True)
+    except (OSError, subprocess.CalledProcessError) as error:
+        logging.info('ERROR: Unable to list the files changed since %s: %s', git_ref,
+                     (getattr(error, 'stderr', None) or str(error)).strip())
+        sys.exit(1)
+    return result.stdout.splitlines()
+
+
+def read_changed_paths(stream):
+    """Return the non-empty paths of a stream, one path per line."""
+    return [line.strip() for line in stream if line.strip()]
+
+
+def map_changed_path(path):
+    """Return the (metadata type, member) of a separated label or workflow file, or None for other files."""
+    parts = path.replace('\\', '/').split('/')
+    filename = parts[-1]
+    if filename.endswith('.label-meta.xml'):
+        return component_index.LABEL_TYPE, filename[:-len('.label-meta.xml')]
+    if 'workflows' not in parts:
+        return None
+    workflow_parts = parts[len(parts) - parts[::-1].index('workflows'):]
+    if len(workflow_parts) == 1 and filename.endswith('.workflow-meta.xml'):
+        return component_index.WORKFLOW_TYPE, filename[:-len('.workflow-meta.xml')]
+    if len(workflow_parts) == 3 and workflow_parts[1] in component_index.WORKFLOW_CHILD_FOLDERS:
+        parent_workflow_name, type_folder = workflow_parts[0], workflow_parts[1]
+        suffix = f'.{type_folder}-meta.xml'
+        if filename.endswith(suffix):
+            return (component_index.WORKFLOW_CHILD_FOLDERS[type_folder],
+                    f'{parent_workflow_name}.{filename[:-len(suffix)]}')
+    return None
+
+
+def has_workflow_elements(workflow_directory, parent_workflow_name):
+    """Return True if separated workflow elements of an object are left."""
+    object_directory = os.path.join(workflow_directory, parent_workflow_name)
+    return (os.path.isdir(object_directory)
+            and bool(metadata_engine.walk_separated_files(metadata_registry.WORKFLOWS, object_directory)))
+
+
+def build_delta_manifest(changed_paths, workflow_directory, api_version=None):
+    """Build the PackageManifest of the labels and workflows changed by the paths.
+
+    Deleted labels are left out of the package. A deleted workflow element still adds its parent workflow,
+    which is combined without it, unless no element of the object is left.
+    """
+    manifest = parse_package.PackageManifest()
+    manifest.set_api_version(api_version)
+    # Objects with deleted elements, with whether they have elements left, so each folder is only listed once
+    remaining_objects = {}
+    for path in changed_paths:
+        component = map_changed_path(path)
+        if component is None:
+            continue
+        metadata_name, member = component
+        if os.path.isfile(path):
+            manifest.add_members(metadata_name, [member])
+        elif metadata_name == component_index.LABEL_TYPE:
+            logging.info('The label %s was deleted and is not added to the package.', member)
+        else:
+            parent_workflow_name = member.split('.')[0]
+            if parent_workflow_name in remaining_objects:
+                continue
+            remaining_objects[parent_workflow_name] = has_workflow_elements(workflow_directory, parent_workflow_name)
+            if remaining_objects[parent_workflow_name]:
+                manifest.add_members(component_index.WORKFLOW_TYPE, [parent_workflow_name])
+            else:
+                logging.info('The workflows of %s were deleted and are not added to the package.',
+                             parent_workflow_name)
+    return manifest
+
+
+def create_delta_package(changed_paths, output_file, api_version=None, label_directory=parse_package.LABEL_DIRECTORY,
+                         label_file=parse_package.LABEL_FILE, workflow_directory=parse_package.WORKFLOW_DIRECTORY,
+                         index_file=None):
+    """Write the delta package of the changed paths and combine its labels and workflows."""
+    manifest = build_delta_manifest(changed_paths, workflow_directory, api_version)
+    if not manifest.labels and not manifest.workflows:
+        logging.info('No labels or workflows changed.')
+    index = parse_package.load_component_index(index_file, manifest) if index_file else None
+
+    if manifest.labels:
+        combine_labels.combine_labels(label_directory, label_file, True, manifest.labels, index=index)
+    if manifest.workflows:
+        combine_workflows.combine_workflows(workflow_directory, True, manifest.workflows, index=index)
+    parse_package.create_package_file(manifest.types, manifest.api_version, output_file)
+    return manifest
+
+
+def main(inputs):
+    """Main function."""
+    with metrics.phase('discovery'):
+        changed_paths = read_git_diff(inputs.git_ref) if inputs.git_ref else read_changed_paths(sys.stdin)
+    create_delta_package(changed_paths, inputs.output, inputs.api_version, inputs.label_directory,
+                         inputs.file, inputs.workflow_directory, inputs.index)
+
+
+if __name__ == '__main__':
+    inputs = parse_args()
+    metrics.configure_logging(inputs)
+    main(inputs)
+    metrics.report('delta_package', inputs)
@@ -0,0 +1,44 @@
+"""Deployment zip output for the combined files.
+
+The combined files are streamed into a zip in the layout the Metadata API
+deploys, with the package.xml at the root and each combined file in the
+folder of its type without the -meta.xml suffix, like
+workflows/Case.workflow. The zip is written to a path or to any binary file
+object, such as an io.BytesIO buffer, so the source tree is left untouched.
+"""
+import io
+import zipfile
+
+import metrics
+import xml_writer
+
+PACKAGE_FILENAME = 'package.xml'
+
+
+def open_archive(output):
+    """Open a new deployment zip at a path or in a binary file object."""
+    return zipfile.ZipFile(output, 'w', compression=zipfile.ZIP_DEFLATED)
+
+
+def _count_entry(archive, name):
+    """Count a zip entry written and its uncompressed size."""
+    metrics.count('files_written')
+    metrics.count('bytes_written', archive.getinfo(name).file_size)
+
+
+def write_fragments(archive, name, root, fragments):
+    """Stream the root element around the formatted fragments into a zip entry.
+
+    Fragments generated while they are written are timed in their own phases.
+    """
+    with metrics.phase('write'):
+        with io.TextIOWrapper(archive.open(name, 'w'), encoding='utf-8', newline='') as stream:
+            xml_writer.write_xml_fragments(root, fragments, stream)
+        _count_entry(archive, name)
+
+
+def write_bytes(archive, name, content):
+    """Write the content of a file into a zip entry."""
+    with metrics.phase('write'):
+        archive.writestr(name, content)
+        _count_entry(archive, name)
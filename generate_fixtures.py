@@ -0,0 +1,166 @@
+import argparse
+import logging
+import os
+import random
+import xml.etree.ElementTree as ET
+
+import metadata_registry
+import xml_writer
+
+WORKFLOW_TYPES = ['alerts', 'fieldUpdates', 'outboundMessages', 'rules', 'tasks']
+PACKAGE_TYPES = metadata_registry.WORKFLOWS.child_types
+WORDS = ['account', 'approval', 'case', 'contact', 'escalation', 'invoice', 'lead', 'order',
+         'priority', 'quote', 'renewal', 'review', 'status', 'update', 'warning']
+
+
+def parse_args():
+    """Function to parse command line arguments."""
+    parser = argparse.ArgumentParser(description='A script to generate a synthetic org with decomposed labels '
+                                                 'and workflows.')
+    parser.add_argument('-o', '--output', default='benchmark-org')
+    parser.add_argument('-l', '--labels', type=int, default=10000)
+    parser.add_argument('-w', '--objects', type=int, default=200,
+                        help='Number of objects with workflows.')
+    parser.add_argument('-e', '--elements', type=int, default=20,
+                        help='Average number of elements of each workflow type per object.')
+    parser.add_argument('-p', '--package-size', type=int, default=50,
+                        help='Number of labels and workflow elements declared in the generated package.xml.')
+    parser.add_argument('-s', '--seed', type=int, default=0)
+    args = parser.parse_args()
+    return args
+
+
+def sentence(rng, words):
+    """Return a sentence made of random words."""
+    return ' '.join(rng.choice(WORDS) for _ in range(words)).capitalize()
+
+
+def add_children(parent, children):
+    """Add a child element with text for each (tag, text) pair."""
+    for tag, text in children:
+        ET.SubElement(parent, tag).text = text
+    return parent
+
+
+def build_label(rng, full_name):
+    """Build the XML of a custom label."""
+    return add_children(ET.Element('labels'), [
+        ('fullName', full_name),
+        ('categories', rng.choice(WORDS)),
+        ('language', 'en_US'),
+        ('protected', rng.choice(['true', 'false'])),
+        ('shortDescription', sentence(rng, 3)),
+        ('value', sentence(rng, rng.randint(3, 30)) + ' & <done>'),
+    ])
+
+
+def build_workflow_element(rng, workflow_type, full_name, object_name):
+    """Build the XML of a workflow element."""
+    element = add_children(ET.Element(workflow_type), [('fullName', full_name)])
+    if workflow_type == 'rules':
+        for _ in range(rng.randint(1, 4)):
+            add_children(ET.SubElement(element, 'actions'), [('name', f'Action_{rng.randint(0, 999)}'),
+                                                             ('type', rng.choice(['Alert', 'FieldUpdate', 'Task']))])
+        add_children(element, [('active', rng.choice(['true', 'false']))])
+        add_children(ET.SubElement(element, 'criteriaItems'), [('field', f'{object_name}.Status'),
+                                                                ('operation', 'equals'),
+                                                                ('value', rng.choice(WORDS))])
+        add_children(element, [('description', sentence(rng, 8)),
+                               ('triggerType', 'onCreateOrTriggeringUpdate')])
+    elif workflow_type == 'fieldUpdates':
+        add_children(element, [('field', f'{rng.choice(WORDS).capitalize()}__c'),
+                               ('formula', f'"{sentence(rng, 4)}"'),
+                               ('name', sentence(rng, 3)),
+                               ('notifyAssignee', 'false'),
+                               ('operation', 'Formula'),
+                               ('protected', 'false')])
+    elif workflow_type == 'alerts':
+        add_children(element, [('description', sentence(rng, 5)),
+                               ('protected', 'false')])
+        add_children(ET.SubElement(element, 'recipients'), [('type', 'owner')])
+        add_children(element, [('senderType', 'CurrentUser'),
+                               ('template', f'unfiled$public/{rng.choice(WORDS)}_template')])
+    elif workflow_type == 'outboundMessages':
+        add_children(element, [('apiVersion', '59.0'),
+                               ('endpointUrl', f'https://example.com/{rng.choice(WORDS)}'),
+                               ('fields', 'Id'),
+                               ('includeSessionId', 'false'),
+                               ('integrationUser', 'integration@example.com'),
+                               ('name', sentence(rng, 3)),
+                               ('protected', 'false'),
+                               ('useDeadLetterQueue', 'false')])
+    else:
+        add_children(element, [('assignedToType', 'owner'),
+                               ('dueDateOffset', str(rng.randint(0, 30))),
+                               ('notifyAssignee', 'false'),
+                               ('priority', rng.choice(['High', 'Normal', 'Low'])),
+                               ('protected', 'false'),
+                               ('status', 'Not Started'),
+                               ('subject', sentence(rng, 4))])
+    return element
+
+
+def write_package(package_path, package_labels, package_workflows):
+    """Write a delta package.xml for the sampled labels and workflow elements."""
+    lines = ['<?xml version="1.0" encoding="UTF-8"?>',
+             '<Package xmlns="http://soap.sforce.com/2006/04/metadata">']
+    if package_labels:
+        lines.append('    <types>')
+        lines.extend(f'        <members>{label}</members>' for label in package_labels)
+        lines.extend(['        <name>CustomLabel</name>', '    </types>'])
+    for package_type, members in sorted(package_workflows.items()):
+        lines.append('    <types>')
+        lines.extend(f'        <members>{member}</members>' for member in members)
+        lines.extend([f'        <name>{package_type}</name>', '    </types>'])
+    lines.extend(['    <version>59.0</version>', '</Package>'])
+    with open(package_path, 'w', encoding='utf-8') as package_file:
+        package_file.write('\n'.join(lines) + '\n')
+
+
+def generate_org(output_directory, labels, objects, elements, package_size=50, seed=0):
+    """Generate a decomposed org with the given number of labels, objects and elements per workflow type."""
+    rng = random.Random(seed)
+    source_directory = os.path.join(output_directory, 'force-app', 'main', 'default')
+    label_directory = os.path.join(source_directory, 'labels')
+    workflow_directory = os.path.join(source_directory, 'workflows')
+    os.makedirs(label_directory, exist_ok=True)
+    os.makedirs(os.path.join(output_directory, 'manifest'), exist_ok=True)
+
+    label_names = [f'Label_{index:06d}' for index in range(labels)]
+    for label_name in label_names:
+        xml_writer.write_xml_file(build_label(rng, label_name),
+                                  os.path.join(label_directory, f'{label_name}.label-meta.xml'))
+
+    workflow_members = []
+    for object_index in range(objects):
+        object_name = f'Object_{object_index:04d}__c'
+        for workflow_type in WORKFLOW_TYPES:
+            subfolder = os.path.join(workflow_directory, object_name, workflow_type)
+            os.makedirs(subfolder, exist_ok=True)
+            for element_index in range(rng.randint(max(elements // 2, 1), elements + elements // 2)):
+                full_name = f'{workflow_type.capitalize()}_{element_index:04d}'
+                element = build_workflow_element(rng, workflow_type, full_name, object_name)
+                xml_writer.write_xml_file(element,
+                                          os.path.join(subfolder, f'{full_name}.{workflow_type}-meta.xml'))
+                workflow_members.append((PACKAGE_TYPES[workflow_type], f'{object_name}.{full_name}'))
+
+    package_labels = sorted(rng.sample(label_names, min(package_size, len(label_names))))
+    package_workflows = {}
+    for package_type, member in sorted(rng.sample(workflow_members, min(package_size, len(workflow_members)))):
+        package_workflows.setdefault(package_type, []).append(member)
+    write_package(os.path.join(output_directory, 'manifest', 'package.xml'), package_labels, package_workflows)
+
+    logging.info('Generated %d labels and %d workflow elements for %d objects in %s.',
+                 labels, len(workflow_members), objects, output_directory)
+    return source_directory
+
+
+def main(output_directory, labels, objects, elements, package_size, seed):
+    """Main function."""
+    generate_org(output_directory, labels, objects, elements, package_size, seed)
+
+
+if __name__ == '__main__':
+    logging.basicConfig(format='%(message)s', level=logging.DEBUG)
+    inputs = parse_args()
+    main(inputs.output, inputs.labels, inputs.objects, inputs.elements, inputs.package_size, inputs.seed)
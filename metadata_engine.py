@@ -0,0 +1,395 @@
+import argparse
+import functools
+import logging
+import os
+import xml.etree.ElementTree as ET
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+
+import component_index
+import metadata_registry
+import metrics
+import xml_backend
+import xml_writer
+
+OPERATIONS = ['decompose', 'compose']
+SOURCE_DIRECTORY = 'force-app/main/default'
+
+
+def parse_args():
+    """Function to parse command line arguments."""
+    parser = argparse.ArgumentParser(description='A script to separate and combine every registered metadata type '
+                                                 'in a single traversal of the source directory.')
+    parser.add_argument('operations', nargs='+', choices=OPERATIONS,
+                        help='Operations to run in order.')
+    parser.add_argument('--source', default=SOURCE_DIRECTORY,
+                        help='Directory holding the folder of each metadata type.')
+    parser.add_argument('-t', '--types', nargs='+', choices=list(metadata_registry.TYPES),
+                        default=list(metadata_registry.TYPES))
+    parser.add_argument('-j', '--jobs', type=int, default=1,
+                        help='Number of worker processes used to separate and combine the files.')
+    parser.add_argument('-s', '--sync', default=False, action='store_true',
+                        help='Delete separated files that are no longer in the combined files.')
+    parser.add_argument('--prune-missing-objects', default=False, action='store_true',
+                        help='Also delete the separated files of objects without a combined file. Only use it after '
+                             'retrieving every object.')
+    metrics.add_arguments(parser)
+    args = parser.parse_args()
+    return args
+
+
+def find_type_directories(source_directory, types):
+    """Return the registered type and folder of each requested type found with a single listing of the source."""
+    with metrics.phase('discovery'):
+        if not os.path.isdir(source_directory):
+            return []
+        return [(metadata_registry.TYPES[entry], os.path.join(source_directory, entry))
+                for entry in sorted(os.listdir(source_directory))
+                if entry in types and os.path.isdir(os.path.join(source_directory, entry))]
+
+
+def extract_full_name(element, metadata_type):
+    """Return the name of a component from its naming element."""
+    name_element = element.find(f'{{{metadata_registry.NAMESPACE}}}{metadata_type.naming_key}')
+    return name_element.text if name_element is not None else None
+
+
+def get_separated_directory(metadata_type, directory, parent_name, tag):
+    """Return the folder of the separated files of a tag."""
+    if metadata_type.layout == metadata_registry.FLAT:
+        return directory
+    return os.path.join(directory, parent_name, tag)
+
+
+def get_member_name(metadata_type, parent_name, full_name):
+    """Return the package.xml member of a separated component, prefixed by its object for object types."""
+    if metadata_type.layout == metadata_registry.FLAT:
+        return full_name
+    return f'{parent_name}.{full_name}'
+
+
+def get_separated_folders(metadata_type, directory, parent_name):
+    """Return each folder of the separated files of a combined file with the tag of each file suffix."""
+    if metadata_type.layout == metadata_registry.FLAT:
+        return [(directory, {f'.{metadata_type.child_suffix(tag)}-meta.xml': tag for tag in metadata_type.child_types})]
+    object_directory = os.path.join(directory, parent_name)
+    if not os.path.isdir(object_directory):
+        return []
+    return [(os.path.join(object_directory, tag), {f'.{tag}-meta.xml': tag})
+            for tag in sorted(os.listdir(object_directory)) if os.path.isdir(os.path.join(object_directory, tag))]
+
+
+def find_other_files(metadata_type, directory, parent_name, separated_files):
+    """Return the path, tag and name of the separated files of a combined file that are not in it."""
+    other_files = []
+    for folder, suffixes in get_separated_folders(metadata_type, directory, parent_name):
+        for filename in sorted(os.listdir(folder)):
+            file_path = os.path.join(folder, filename)
+            suffix = next((suffix for suffix in suffixes if filename.endswith(suffix)), None)
+            if suffix and file_path not in separated_files:
+                other_files.append((file_path, suffixes[suffix], filename[:-len(suffix)]))
+    return other_files
+
+
+def prune_separated_files(metadata_type, directory, parent_name, separated_files, index=None):
+    """Delete the separated files of a combined file that are not in it and return how many were deleted.
+
+    The deleted components are also removed from the index if one is given.
+    """
+    other_files = find_other_files(metadata_type, directory, parent_name, separated_files)
+    for file_path, tag, full_name in other_files:
+        os.remove(file_path)
+        if index is not None and tag in metadata_type.child_types:
+            index.remove(metadata_type.child_types[tag], get_member_name(metadata_type, parent_name, full_name))
+        logging.debug('Deleted %s', file_path)
+        metrics.count('files_deleted')
+    for folder, _ in get_separated_folders(metadata_type, directory, parent_name):
+        if folder != directory and not os.listdir(folder):
+            os.rmdir(folder)
+    return len(other_files)
+
+
+def index_other_files(metadata_type, directory, parent_name, separated_files, index):
+    """Index the separated files of a combined file that are not in it, as they are still combined."""
+    for file_path, tag, full_name in find_other_files(metadata_type, directory, parent_name, separated_files):
+        if tag in metadata_type.child_types:
+            component_index.add_file(index, metadata_type.child_types[tag],
+                                     get_member_name(metadata_type, parent_name, full_name), file_path,
+                                     parent_name if metadata_type.layout == metadata_registry.OBJECT else None)
+
+
+def prune_separated_objects(metadata_type, directory, index=None):
+    """Delete the separated files of the objects without a combined file and return how many were deleted."""
+    deleted = 0
+    for parent_name in sorted(os.listdir(directory)):
+        object_directory = os.path.join(directory, parent_name)
+        if (not os.path.isdir(object_directory)
+                or os.path.isfile(os.path.join(directory, metadata_type.combined_filename(parent_name)))):
+            continue
+        deleted += prune_separated_files(metadata_type, directory, parent_name, set(), index)
+        if not os.listdir(object_directory):
+            os.rmdir(object_directory)
+    return deleted
+
+
+def decompose_file(metadata_type, directory, filename, sync=False, index=None):
+    """Separate the components of a combined file and return the counts of written, unchanged, skipped and
+    deleted files, with a failed count if the file could not be read.
+
+    With sync, the separated files of components that are no longer in the combined file are deleted. If an index
+    is given, it is updated with the separated files, the ones that are kept as well.
+    """
+    parent_name = metadata_type.parent_name(filename)
+    combined_path = os.path.join(directory, filename)
+    counts = Counter()
+    separated_files = set()
+    # The elements are streamed, so each subfolder is created the first time one of its elements is reached
+    subfolders = set()
+
+    try:
+        for element in xml_backend.iter_children(combined_path):
+            full_name = extract_full_name(element, metadata_type)
+            if not full_name:
+                logging.info('Skipping %s element without %s', element.tag, metadata_type.naming_key)
+                counts['skipped'] += 1
+                continue
+            tag = element.tag.split('}')[-1]
+            subfolder = get_separated_directory(metadata_type, directory, parent_name, tag)
+            if subfolder not in subfolders:
+                os.makedirs(subfolder, exist_ok=True)
+                subfolders.add(subfolder)
+            output_filename = os.path.join(subfolder, metadata_type.separated_filename(tag, full_name))
+            separated_files.add(output_filename)
+            content = xml_writer.xml_to_bytes(xml_backend.strip_namespaces(element))
+            if index is not None and tag in metadata_type.child_types:
+                index.add(metadata_type.child_types[tag], get_member_name(metadata_type, parent_name, full_name),
+                          output_filename, *component_index.describe_content(content),
+                          parent_name if metadata_type.layout == metadata_registry.OBJECT else None)
+            if xml_writer.write_bytes_if_changed(content, output_filename):
+                logging.debug('Saved %s element content to %s', tag, output_filename)
+                counts['written'] += 1
+            else:
+                counts['unchanged'] += 1
+    except FileNotFoundError:
+        logging.info("Error: XML file '%s' not found.", combined_path)
+        counts['failed'] += 1
+        return counts
+    except xml_backend.ParseError:
+        logging.info("Error: Unable to parse the XML file %s.", combined_path)
+        counts['failed'] += 1
+        return counts
+
+    if sync:
+        counts['deleted'] = prune_separated_files(metadata_type, directory, parent_name, separated_files, index)
+    elif index is not None:
+        index_other_files(metadata_type, directory, parent_name, separated_files, index)
+    return counts
+
+
+def is_separated_file(metadata_type, filename):
+    """Return True if the file is a separated component and not a combined file."""
+    return filename.endswith('.xml') and metadata_type.parent_name(filename) is None
+
+
+def walk_separated_files(metadata_type, object_directory):
+    """Return the separated files found under the folder of an object in sorted order."""
+    with metrics.phase('discovery'):
+        file_paths = []
+        for root, directories, files in os.walk(object_directory):
+            # Sort the folders and files so the order of the elements of each tag is deterministic
+            directories.sort()
+            file_paths.extend(os.path.join(root, filename) for filename in sorted(files)
+                              if is_separated_file(metadata_type, filename))
+        return file_paths
+
+
+def find_separated_files(metadata_type, directory, parent_name):
+    """Return the separated files of a combined file, in the order they are combined."""
+    if metadata_type.layout == metadata_registry.OBJECT:
+        return walk_separated_files(metadata_type, os.path.join(directory, parent_name))
+    with metrics.phase('discovery'):
+        # Same order as combine_labels, which keeps the directory order
+        return [os.path.join(directory, filename) for filename in os.listdir(directory)
+                if is_separated_file(metadata_type, filename)]
+
+
+def parse_separated_files(file_paths):
+    """Parse the separated files of one combined file, sorted by tag."""
+    individual_roots = [xml_backend.parse(file_path) for file_path in file_paths]
+    with metrics.phase('merge'):
+        # The sort is stable, so the elements of each tag keep the order of their files
+        individual_roots.sort(key=lambda x: x.tag)
+    return individual_roots
+
+
+def read_separated_files(metadata_type, directory, parent_name, members=None):
+    """Read the separated files of one combined file, sorted by tag.
+
+    For flat types, only the given members are read if members are given.
+    """
+    file_paths = find_separated_files(metadata_type, directory, parent_name)
+    if members is not None:
+        package_files = {metadata_type.separated_filename(tag, member)
+                         for tag in metadata_type.child_types for member in members}
+        file_paths = [file_path for file_path in file_paths if os.path.basename(file_path) in package_files]
+    return parse_separated_files(file_paths)
+
+
+def create_combined_root(metadata_type):
+    """Create the root element of a combined file."""
+    return ET.Element(metadata_type.root_tag, xmlns=metadata_registry.NAMESPACE)
+
+
+def format_separated_file(root):
+    """Format a separated file as a fragment of the combined XML."""
+    return '\n'.join(xml_writer.format_merged_element(root, xml_writer.INDENT))
+
+
+def format_individual_xmls(individual_roots):
+    """Format the separated files as fragments of the combined XML."""
+    return (format_separated_file(root) for root in individual_roots)
+
+
+def compose_file(metadata_type, directory, parent_name, members=None):
+    """Combine the separated files of one combined file and return the count of combined components."""
+    individual_roots = read_separated_files(metadata_type, directory, parent_name, members)
+    if not individual_roots:
+        return Counter()
+    xml_writer.write_xml_fragments_file(create_combined_root(metadata_type), format_individual_xmls(individual_roots),
+                                        os.path.join(directory, metadata_type.combined_filename(parent_name)))
+    return Counter(combined=len(individual_roots))
+
+
+def run_task(task, sync=False):
+    """Run a decompose or compose task and return its counts."""
+    operation, type_name, directory, name, members = task
+    metadata_type = metadata_registry.TYPES[type_name]
+    if operation == 'decompose':
+        return decompose_file(metadata_type, directory, name, sync)
+    return compose_file(metadata_type, directory, name, members)
+
+
+def run_in_worker(function, item):
+    """Call a function in a worker process and return its result with the metrics of the worker."""
+    metrics.METRICS.reset()
+    return function(item), metrics.METRICS.snapshot()
+
+
+def map_in_workers(function, items, jobs=1):
+    """Return the result of a function for each item, in worker processes if there are several jobs."""
+    if jobs > 1 and len(items) > 1:
+        # Each item is handled by a single worker, so the output does not depend on the worker count
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            results = []
+            for result, worker_metrics in executor.map(functools.partial(run_in_worker, function), items):
+                results.append(result)
+                metrics.METRICS.merge(worker_metrics)
+        return results
+    return [function(item) for item in items]
+
+
+def run_tasks(tasks, jobs=1, sync=False):
+    """Run the tasks, in worker processes if there are several jobs, and return the counts of each type."""
+    task_counts = map_in_workers(functools.partial(run_task, sync=sync), tasks, jobs)
+    type_counts = {}
+    for task, counts in zip(tasks, task_counts):
+        type_counts.setdefault(task[1], Counter()).update(counts)
+    return type_counts
+
+
+def find_decompose_tasks(type_directories):
+    """Return a task for each combined file of the type folders."""
+    tasks = []
+    with metrics.phase('discovery'):
+        for metadata_type, directory in type_directories:
+            tasks.extend(('decompose', metadata_type.name, directory, filename, None)
+                         for filename in sorted(os.listdir(directory))
+                         if metadata_type.parent_name(filename) is not None
+                         and os.path.isfile(os.path.join(directory, filename)))
+    return tasks
+
+
+def find_compose_tasks(type_directories, components=None):
+    """Return a task for each combined file to build, only for the components given for each type if any."""
+    tasks = []
+    with metrics.phase('discovery'):
+        for metadata_type, directory in type_directories:
+            members = components.get(metadata_type.name) if components is not None else None
+            if metadata_type.layout == metadata_registry.FLAT:
+                tasks.append(('compose', metadata_type.name, directory, None, members))
+                continue
+            parent_names = sorted(entry for entry in os.listdir(directory)
+                                  if os.path.isdir(os.path.join(directory, entry)))
+            if members is not None:
+                parent_names = [parent_name for parent_name in parent_names if parent_name in members]
+            tasks.extend(('compose', metadata_type.name, directory, parent_name, None)
+                         for parent_name in parent_names)
+    return tasks
+
+
+def decompose(source_directory=SOURCE_DIRECTORY, types=None, jobs=1, sync=False, prune_missing_objects=False):
+    """Separate the combined files of every requested type and return the counts of each type.
+
+    With prune_missing_objects, the separated files of objects without a combined file are deleted as well.
+    """
+    type_directories = find_type_directories(source_directory, types or metadata_registry.TYPES)
+    type_counts = run_tasks(find_decompose_tasks(type_directories), jobs, sync)
+    if prune_missing_objects:
+        for metadata_type, directory in type_directories:
+            if metadata_type.layout == metadata_registry.OBJECT:
+                deleted = prune_separated_objects(metadata_type, directory)
+                type_counts.setdefault(metadata_type.name, Counter())['deleted'] += deleted
+    for type_name, counts in sorted(type_counts.items()):
+        logging.info('%s files written: %d, unchanged: %d, skipped: %d, deleted: %d', type_name,
+                     counts['written'], counts['unchanged'], counts['skipped'], counts['deleted'])
+    return type_counts
+
+
+def select_types(types=None, components=None):
+    """Return the requested types, only the ones with components if components are given."""
+    types = types or metadata_registry.TYPES
+    if components is not None:
+        types = [type_name for type_name in types if components.get(type_name)]
+    return types
+
+
+def compose(source_directory=SOURCE_DIRECTORY, types=None, jobs=1, components=None):
+    """Combine the separated files of every requested type for deployments and return the counts of each type.
+
+    With components, only the given members of each type are combined, the objects of object types.
+    """
+    type_directories = find_type_directories(source_directory, select_types(types, components))
+    type_counts = run_tasks(find_compose_tasks(type_directories, components), jobs)
+    for type_name, counts in sorted(type_counts.items()):
+        logging.info('The %s have been compiled for deployments: %d component(s).', type_name, counts['combined'])
+    return type_counts
+
+
+def iter_combined_files(source_directory=SOURCE_DIRECTORY, types=None, components=None):
+    """Yield the type, object, root element and fragments of every combined file without writing it.
+
+    The separated files of each combined file are read when it is reached, so one object is held in memory.
+    """
+    type_directories = find_type_directories(source_directory, select_types(types, components))
+    for _, type_name, directory, parent_name, members in find_compose_tasks(type_directories, components):
+        metadata_type = metadata_registry.TYPES[type_name]
+        individual_roots = read_separated_files(metadata_type, directory, parent_name, members)
+        if individual_roots:
+            yield (metadata_type, parent_name, create_combined_root(metadata_type),
+                   format_individual_xmls(individual_roots))
+
+
+def main(inputs):
+    """Main function."""
+    for operation in inputs.operations:
+        if operation == 'decompose':
+            decompose(inputs.source, inputs.types, inputs.jobs, inputs.sync, inputs.prune_missing_objects)
+        else:
+            compose(inputs.source, inputs.types, inputs.jobs)
+
+
+if __name__ == '__main__':
+    inputs = parse_args()
+    metrics.configure_logging(inputs)
+    main(inputs)
+    metrics.report('metadata_engine', inputs)
@@ -0,0 +1,106 @@
+"""Registry of the bundled metadata types that are separated into one file per component.
+
+Each type declares the folder and the combined files it is stored in, the tags
+of its components with their package.xml type, the element naming the
+component and how the separated files are laid out:
+
+- flat: one combined file for the whole folder, the components are separated
+  next to it, like labels/CustomLabels.labels-meta.xml and
+  labels/<fullName>.label-meta.xml
+- object: one combined file per object, the components are separated into a
+  folder per object and tag, like workflows/Case.workflow-meta.xml and
+  workflows/Case/rules/<fullName>.rules-meta.xml
+"""
+NAMESPACE = 'http://soap.sforce.com/2006/04/metadata'
+FLAT = 'flat'
+OBJECT = 'object'
+
+
+class MetadataType:
+    """Declaration of a bundled metadata type."""
+
+    def __init__(self, name, root_tag, package_type, child_types, layout=OBJECT, suffix=None, combined_file=None,
+                 child_suffixes=None, naming_key='fullName'):
+        # Folder of the type under the source directory, like workflows
+        self.name = name
+        self.root_tag = root_tag
+        # Package type of the combined files
+        self.package_type = package_type
+        # Package type of the components of each tag
+        self.child_types = child_types
+        self.layout = layout
+        # Suffix of the combined files, like workflow for Case.workflow-meta.xml
+        self.suffix = suffix
+        # Name of the combined file of flat types
+        self.combined_file = combined_file
+        # Suffix of the separated files of each tag, the tag itself by default
+        self.child_suffixes = child_suffixes or {}
+        self.naming_key = naming_key
+
+    def child_suffix(self, tag):
+        """Return the suffix of the separated files of a tag."""
+        return self.child_suffixes.get(tag, tag)
+
+    def child_tag(self, component_type):
+        """Return the tag of the components of a package.xml type, like rules for WorkflowRule."""
+        return next(tag for tag, child_type in self.child_types.items() if child_type == component_type)
+
+    def separated_filename(self, tag, full_name):
+        """Return the file name of a separated component."""
+        return f'{full_name}.{self.child_suffix(tag)}-meta.xml'
+
+    def combined_filename(self, parent_name=None):
+        """Return the file name of a combined file, the one of its object for object types."""
+        if self.layout == FLAT:
+            return self.combined_file
+        return f'{parent_name}.{self.suffix}-meta.xml'
+
+    def deploy_filename(self, parent_name=None):
+        """Return the path of a combined file in a Metadata API deployment, like workflows/Case.workflow."""
+        return f'{self.name}/{self.combined_filename(parent_name)[:-len("-meta.xml")]}'
+
+    def parent_name(self, combined_filename):
+        """Return the object of a combined file name, or None if it is not a combined file of this type."""
+        if self.layout == FLAT:
+            return self.name if combined_filename == self.combined_file else None
+        suffix = f'.{self.suffix}-meta.xml'
+        return combined_filename[:-len(suffix)] if combined_filename.endswith(suffix) else None
+
+
+LABELS = MetadataType('labels', 'CustomLabels', 'CustomLabels', {'labels': 'CustomLabel'}, layout=FLAT,
+                      combined_file='CustomLabels.labels-meta.xml', child_suffixes={'labels': 'label'})
+WORKFLOWS = MetadataType('workflows', 'Workflow', 'Workflow', {
+    'alerts': 'WorkflowAlert',
+    'fieldUpdates': 'WorkflowFieldUpdate',
+    'flowActions': 'WorkflowFlowAction',
+    'knowledgePublishes': 'WorkflowKnowledgePublish',
+    'outboundMessages': 'WorkflowOutboundMessage',
+    'rules': 'WorkflowRule',
+    'tasks': 'WorkflowTask',
+}, suffix='workflow')
+SHARING_RULES = MetadataType('sharingRules', 'SharingRules', 'SharingRules', {
+    'sharingCriteriaRules': 'SharingCriteriaRule',
+    'sharingGuestRules': 'SharingGuestRule',
+    'sharingOwnerRules': 'SharingOwnerRule',
+    'sharingTerritoryRules': 'SharingTerritoryRule',
+}, suffix='sharingRules')
+ASSIGNMENT_RULES = MetadataType('assignmentRules', 'AssignmentRules', 'AssignmentRules',
+                                {'assignmentRule': 'AssignmentRule'}, suffix='assignmentRules')
+ESCALATION_RULES = MetadataType('escalationRules', 'EscalationRules', 'EscalationRules',
+                                {'escalationRule': 'EscalationRule'}, suffix='escalationRules')
+AUTO_RESPONSE_RULES = MetadataType('autoResponseRules', 'AutoResponseRules', 'AutoResponseRules',
+                                   {'autoResponseRule': 'AutoResponseRule'}, suffix='autoResponseRules')
+
+# Registered types by folder name
+TYPES = {metadata_type.name: metadata_type for metadata_type in [
+    LABELS, WORKFLOWS, SHARING_RULES, ASSIGNMENT_RULES, ESCALATION_RULES, AUTO_RESPONSE_RULES]}
+
+
+def find_package_type(package_type):
+    """Return the registered type of a package.xml type and whether it is a component type, or (None, False)."""
+    for metadata_type in TYPES.values():
+        if package_type == metadata_type.package_type:
+            return metadata_type, False
+        if package_type in metadata_type.child_types.values():
+            return metadata_type, True
+    return None, False
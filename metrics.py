@@ -0,0 +1,160 @@
+"""Per-phase timing and counters shared by the scripts.
+
+Phases are timed exclusively: the time of a phase started inside another one,
+like parsing a file while the combined file is written, only counts for the
+inner phase. The scripts report the metrics with --profile or --metrics-json.
+"""
+import json
+import logging
+import sys
+import time
+from collections import Counter
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+PHASES = ['discovery', 'parse', 'merge', 'serialize', 'write']
+
+
+class Phase:
+    """Context manager timing one phase, which can also be started and stopped several times."""
+    __slots__ = ('metrics', 'name', 'start')
+
+    def __init__(self, metrics, name):
+        self.metrics = metrics
+        self.name = name
+        self.start = 0.0
+
+    def __enter__(self):
+        return self.begin()
+
+    def __exit__(self, *exc_info):
+        self.end()
+
+    def begin(self):
+        """Start timing the phase."""
+        self.start = time.perf_counter()
+        self.metrics.nested.append(0.0)
+        return self
+
+    def end(self):
+        """Stop timing the phase and add the time to its total."""
+        elapsed = time.perf_counter() - self.start
+        nested = self.metrics.nested.pop()
+        self.metrics.phases[self.name] = self.metrics.phases.get(self.name, 0.0) + elapsed - nested
+        if self.metrics.nested:
+            self.metrics.nested[-1] += elapsed
+
+
+class Metrics:
+    """Phase timings and file counters of a run."""
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.phases = {}
+        self.counters = Counter()
+        self.nested = []
+
+    def phase(self, name):
+        """Return a context manager timing a phase."""
+        return Phase(self, name)
+
+    def count(self, name, amount=1):
+        """Increase a counter."""
+        self.counters[name] += amount
+
+    def snapshot(self):
+        """Return the phases and counters, to merge them in another process."""
+        return {'phases': dict(self.phases), 'counters': dict(self.counters)}
+
+    def merge(self, snapshot):
+        """Add the phases and counters of a snapshot, such as the ones of a worker process."""
+        for name, seconds in snapshot['phases'].items():
+            self.phases[name] = self.phases.get(name, 0.0) + seconds
+        self.counters.update(snapshot['counters'])
+
+    def reset(self):
+        """Clear the phases and counters and restart the wall clock."""
+        self.start = time.perf_counter()
+        self.phases = {}
+        self.counters = Counter()
+        self.nested = []
+
+    def to_dict(self, script):
+        """Return the metrics of the run as a JSON serializable dictionary."""
+        phases = {name: round(self.phases.get(name, 0.0), 6) for name in PHASES}
+        phases.update((name, round(seconds, 6)) for name, seconds in self.phases.items() if name not in phases)
+        return {
+            'script': script,
+            'wall_seconds': round(time.perf_counter() - self.start, 6),
+            'peak_rss_kb': peak_rss_kb(),
+            'phases': phases,
+            'counters': dict(sorted(self.counters.items())),
+        }
+
+
+METRICS = Metrics()
+
+
+def phase(name):
+    """Return a context manager timing a phase of the run."""
+    return Phase(METRICS, name)
+
+
+def count(name, amount=1):
+    """Increase a counter of the run."""
+    METRICS.counters[name] += amount
+
+
+PROC_STATUS = '/proc/self/status'
+
+
+def peak_rss_kb():
+    """Return the peak resident memory of this process in KB, or None if it is not available."""
+    # On Linux, ru_maxrss keeps the peak of the process that started this program, while VmHWM starts over
+    try:
+        with open(PROC_STATUS, 'r', encoding='utf-8') as status:
+            for line in status:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    if resource is None:
+        return None
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # macOS reports bytes, Linux reports kilobytes
+    return peak_rss // 1024 if sys.platform == 'darwin' else peak_rss
+
+
+def add_arguments(parser):
+    """Add the logging and metrics arguments to a script's parser."""
+    parser.add_argument('-v', '--verbose', default=False, action='store_true',
+                        help='Log every file written or deleted and other details.')
+    parser.add_argument('--profile', default=False, action='store_true',
+                        help='Log the time of each phase and the files and bytes read and written.')
+    parser.add_argument('--metrics-json', default=None,
+                        help='Write the phase timings, counters and peak memory to this JSON file.')
+
+
+def configure_logging(inputs):
+    """Configure logging, with per-file messages only in verbose mode."""
+    logging.basicConfig(format='%(message)s', level=logging.DEBUG if inputs.verbose else logging.INFO)
+
+
+def report(script, inputs):
+    """Log and save the metrics of the run as requested by the script arguments."""
+    if not inputs.profile and not inputs.metrics_json:
+        return
+    run_metrics = METRICS.to_dict(script)
+    if inputs.profile:
+        logging.info('Profile of %s: %.3fs, peak RSS %s KB', script, run_metrics['wall_seconds'],
+                     run_metrics['peak_rss_kb'])
+        for name, seconds in run_metrics['phases'].items():
+            logging.info('  %-10s %.3fs', name, seconds)
+        for name, value in run_metrics['counters'].items():
+            logging.info('  %s: %d', name, value)
+    if inputs.metrics_json:
+        with open(inputs.metrics_json, 'w', encoding='utf-8') as metrics_file:
+            json.dump(run_metrics, metrics_file, indent=2)
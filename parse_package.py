@@ -1,133 +1,379 @@
 import argparse
 import logging
+import os
 import sys
-import xml.etree.ElementTree as ET
 
 import combine_labels
 import combine_workflows
+import component_index
+import deploy_zip
+import metadata_engine
+import metadata_registry
+import metrics
+import xml_backend
+import xml_writer
 
-LABEL_TYPE = ['CustomLabel']
-INVALID_LABEL_TYPE = ['CustomLabels']
-WORKFLOW_PARENT_TYPE = ['Workflow']
-WORKFLOW_CHILD_TYPES = ['WorkflowAlert', 'WorkflowFieldUpdate', 'WorkflowFlowAction',
-                  'WorkflowKnowledgePublish', 'WorkflowOutboundMessage', 'WorkflowRule',
-                  'WorkflowTask']
+SOURCE_DIRECTORY = 'force-app/main/default'
+LABEL_DIRECTORY = 'force-app/main/default/labels'
+LABEL_FILE = 'force-app/main/default/labels/CustomLabels.labels-meta.xml'
+WORKFLOW_DIRECTORY = 'force-app/main/default/workflows'
+DESTRUCTIVE_PREFIX = 'destructiveChanges'
 
-logging.basicConfig(level=logging.DEBUG, format='%(message)s')
 ns = {'sforce': 'http://soap.sforce.com/2006/04/metadata'}
 
 
 def parse_args():
     """Function to parse required arguments."""
     parser = argparse.ArgumentParser(description='A script to scan the package for labels and workflows.')
-    parser.add_argument('-m', '--manifest', default='./manifest/package.xml')
+    parser.add_argument('-m', '--manifest', nargs='+', default=['./manifest/package.xml'],
+                        help='One or more packages to deploy, merged into a single package.')
+    parser.add_argument('--destructive', nargs='+', default=None,
+                        help='Destructive packages, like destructiveChanges.xml, checked against the packages to '
+                             'deploy but never merged into them.')
+    parser.add_argument('-o', '--output', default=None,
+                        help='Write the merged and adjusted package to this file.')
+    parser.add_argument('-i', '--index', default=None,
+                        help='Component index used to validate the package and find its labels and workflows.')
+    parser.add_argument('-z', '--zip', default=None,
+                        help='Write the combined files and the adjusted package to this deployment zip '
+                             'instead of the source tree.')
+    metrics.add_arguments(parser)
     args = parser.parse_args()
     return args
 
 
-def set_dictionary_members(package_members, package_dict):
-    """Add metadata members in package to a dictionary."""
-    for member in package_members:
-        package_dict[member] = True
-    return package_dict
+class PackageManifest:
+    """Metadata declared in one or more package.xml files, each read in a single pass."""
 
+    def __init__(self, source_directory=SOURCE_DIRECTORY):
+        # Members of every type, with the separated children of object types replaced by their parent object
+        self.types = {}
+        # Components to combine by registered type, the objects of object types
+        self.components = {name: {} for name in metadata_registry.TYPES}
+        # Package types of the parent objects that replaced children in the package
+        self.parent_types = set()
+        self.api_version = None
+        # Folder of the types separated by the metadata engine
+        self.source_directory = source_directory
 
-def parse_package_file(root, changes):
-    """Parse the package roots and append the metadata types to a dictionary."""
-    for metadata_type in root.findall('sforce:types', ns):
-        metadata_name = metadata_type.find('sforce:name', ns).text
-        metadata_member_list = metadata_type.findall('sforce:members', ns)
-        # If workflow child, determine Parent workflow and add to `Workflow` metadata type
-        if metadata_name in WORKFLOW_CHILD_TYPES:
-            changes.setdefault('Workflow', set()).update(metadata_member.text.split('.')[0] for metadata_member in metadata_member_list)
+    @property
+    def labels(self):
+        """Labels to combine."""
+        return self.components[metadata_registry.LABELS.name]
+
+    @property
+    def workflows(self):
+        """Parent workflows to combine."""
+        return self.components[metadata_registry.WORKFLOWS.name]
+
+    def add_package(self, root):
+        """Add the types of a package root to the manifest."""
+        for metadata_type in root.findall('sforce:types', ns):
+            name_element = metadata_type.find('sforce:name', ns)
+            metadata_name = name_element.text if name_element is not None else None
+            members = [member.text for member in metadata_type.findall('sforce:members', ns) if member.text]
+            self.add_members(metadata_name, members)
+
+        version_element = root.find('sforce:version', ns)
+        if version_element is not None:
+            self.set_api_version(version_element.text)
+
+    def add_members(self, metadata_name, members):
+        """Add the members of a metadata type to the manifest."""
+        metadata_type, is_component = metadata_registry.find_package_type(metadata_name)
+        if metadata_type is not None and metadata_type.layout == metadata_registry.FLAT and not is_component:
+            component_type = next(iter(metadata_type.child_types.values()))
+            logging.info('ERROR: The metadata type `%s` (plural) is not allowed in delta deployments.', metadata_name)
+            logging.info('Update the package.xml to use `%s` (singular) and declare specific %s to deploy.',
+                         component_type, metadata_type.name)
+            sys.exit(1)
+        # If the child of an object type, like a workflow rule, add its parent object to the parent type
+        if is_component and metadata_type.layout == metadata_registry.OBJECT:
+            # Workflows are always separated, the other types only where their separated folder exists
+            if metadata_type is not metadata_registry.WORKFLOWS:
+                separated_members = [member for member in members
+                                     if self.is_separated(metadata_type, metadata_name, member)]
+                other_members = [member for member in members if member not in separated_members]
+                if other_members:
+                    self.types.setdefault(metadata_name, set()).update(other_members)
+                members = separated_members
+            if not members:
+                return
+            parent_objects = [member.split('.')[0] for member in members]
+            self.components[metadata_type.name].update(dict.fromkeys(parent_objects, True))
+            self.types.setdefault(metadata_type.package_type, set()).update(parent_objects)
+            self.parent_types.add(metadata_type.package_type)
+            return
+        if metadata_type is not None:
+            self.components[metadata_type.name].update(dict.fromkeys(members, True))
         # Otherwise, add metadata as-is to package unless there is a wildcard
-        elif metadata_name and '*' not in metadata_name.strip():
-            changes.setdefault(metadata_name, set()).update(metadata_member.text for metadata_member in metadata_member_list)
-        elif '*' in metadata_name:
+        if metadata_name and '*' not in metadata_name.strip():
+            self.types.setdefault(metadata_name, set()).update(members)
+        elif metadata_name:
             logging.warning('WARNING: Wildcards are not allowed in the delta deployment package.')
 
-    api_version = root.find('sforce:version', ns).text if root.find('sforce:version', ns) is not None else None
-    return changes, api_version
+    def is_separated(self, metadata_type, metadata_name, member):
+        """Return True if the folder of the separated files of the object and type of a child member exists."""
+        return os.path.isdir(os.path.join(self.source_directory, metadata_type.name, member.split('.')[0],
+                                          metadata_type.child_tag(metadata_name)))
 
+    def set_api_version(self, api_version):
+        """Keep the highest API version of the merged packages."""
+        if api_version and (not self.api_version or float(api_version) > float(self.api_version)):
+            self.api_version = api_version
 
-def create_package_file(items, api_version, output_file):
-    """Create the final package.xml file."""
-    pkg_header = '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
-    pkg_header += '<Package xmlns="http://soap.sforce.com/2006/04/metadata">\n'
 
+def format_package(items, api_version):
+    """Yield the lines of a package.xml with sorted types and sorted, unique members."""
+    yield '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    yield '<Package xmlns="http://soap.sforce.com/2006/04/metadata">\n'
+    for key in sorted(items):
+        yield '\t<types>\n'
+        for member in sorted(set(items[key])):
+            yield f'\t\t<members>{member}</members>\n'
+        yield f'\t\t<name>{key}</name>\n'
+        yield '\t</types>\n'
     # if API version is provided, append to footer
     # otherwise, omit API version to use latest API version in org
     if api_version:
-        pkg_footer = f'\t<version>{api_version}</version>\n</Package>\n'
+        yield f'\t<version>{api_version}</version>\n'
+    yield '</Package>\n'
+
+
+def package_to_bytes(items, api_version):
+    """Return the contents of the final package.xml as UTF-8 encoded bytes."""
+    with metrics.phase('serialize'):
+        package_contents = ''.join(format_package(items, api_version))
+    logging.debug('Deployment package contents:')
+    logging.debug(package_contents)
+    return package_contents.encode('utf-8')
+
+
+def create_package_file(items, api_version, output_file):
+    """Create the final package.xml file, leaving it untouched if the contents did not change."""
+    if xml_writer.write_bytes_if_changed(package_to_bytes(items, api_version), output_file):
+        logging.info('Updated the package %s.', output_file)
     else:
-        pkg_footer = '</Package>\n'
-
-    # Initialize the package contents with the header
-    package_contents = pkg_header
-
-    # Append each item to the package
-    for key in items:
-        package_contents += "\t<types>\n"
-        for member in items[key]:
-            package_contents += "\t\t<members>" + member + "</members>\n"
-        package_contents += "\t\t<name>" + key + "</name>\n"
-        package_contents += "\t</types>\n"
-    # Append the footer to the package
-    package_contents += pkg_footer
-    logging.info('Deployment package contents:')
-    logging.info(package_contents)
-    with open(output_file, 'w', encoding='utf-8') as package_file:
-        package_file.write(package_contents)
-
-
-def scan_package_metadata(package_path):
-    """Scan the package and run the applicable scripts."""
+        logging.info('The package %s is already up to date.', output_file)
+
+
+def read_package_metadata(package_paths, source_directory=SOURCE_DIRECTORY):
+    """Read one or more packages into a single manifest."""
+    if isinstance(package_paths, str):
+        package_paths = [package_paths]
+
+    manifest = PackageManifest(source_directory)
+    for package_path in package_paths:
+        if os.path.basename(package_path).startswith(DESTRUCTIVE_PREFIX):
+            logging.info('ERROR: %s is a destructive package and cannot be merged into the packages to deploy.',
+                         package_path)
+            logging.info('Pass the destructive packages with --destructive instead.')
+            sys.exit(1)
+        manifest.add_package(parse_package_file(package_path))
+    return manifest
+
+
+def parse_package_file(package_path):
+    """Parse a package and exit if it is not valid XML."""
     try:
-        root = ET.parse(package_path).getroot()
-    except ET.ParseError:
+        return xml_backend.parse(package_path)
+    except xml_backend.ParseError:
         logging.info('Unable to parse %s. Confirm XML is formatted correctly before re-trying.', package_path)
         sys.exit(1)
 
-    package_labels = {}
-    package_workflows = {}
-    child_workflows = False
 
-    for metadata_type in root.findall('sforce:types', ns):
-        metadata_name = (metadata_type.find('sforce:name', ns)).text
-        metadata_members = metadata_type.findall('sforce:members', ns)
-        if metadata_name in INVALID_LABEL_TYPE:
-            logging.info('ERROR: The metadata type `CustomLabels` (plural) is not allowed in delta deployments.')
-            logging.info('Update the package.xml to use `CustomLabel` (singular) and declare specific labels to deploy.')
-            sys.exit(1)
-        if metadata_name in LABEL_TYPE:
-            members = [member.text for member in metadata_members]
-            package_labels = set_dictionary_members(members, package_labels)
-        if metadata_name in WORKFLOW_PARENT_TYPE:
-            members = [member.text for member in metadata_members]
-            package_workflows = set_dictionary_members(members, package_workflows)
-        if metadata_name in WORKFLOW_CHILD_TYPES:
-            members = [member.text.split('.')[0] for member in metadata_members]
-            package_workflows = set_dictionary_members(members, package_workflows)
-            child_workflows = True
-
-    if package_labels:
-        combine_labels.combine_labels('force-app/main/default/labels',
-                            'force-app/main/default/labels/CustomLabels.labels-meta.xml', True, package_labels)
-    if package_workflows:
-        combine_workflows.combine_workflows('force-app/main/default/workflows', True, package_workflows)
+def read_destructive_metadata(package_paths):
+    """Read destructive packages into the members of each type, as declared.
+
+    Children of object types are kept as-is, as deleting the parent object would delete all of its children.
+    """
+    destructive_types = {}
+    for package_path in package_paths:
+        for metadata_type in parse_package_file(package_path).findall('sforce:types', ns):
+            name_element = metadata_type.find('sforce:name', ns)
+            if name_element is not None and name_element.text:
+                members = [member.text for member in metadata_type.findall('sforce:members', ns) if member.text]
+                destructive_types.setdefault(name_element.text, set()).update(members)
+    return destructive_types
+
+
+def find_separated_component(metadata_name, member, workflow_directory=WORKFLOW_DIRECTORY,
+                             source_directory=SOURCE_DIRECTORY):
+    """Return the separated file of a child of an object type, like Case.My_Rule for WorkflowRule, or None."""
+    metadata_type, is_component = metadata_registry.find_package_type(metadata_name)
+    if not is_component or metadata_type.layout != metadata_registry.OBJECT or '.' not in member:
+        return None
+    parent_name, full_name = member.split('.', 1)
+    tag = metadata_type.child_tag(metadata_name)
+    type_directory = (workflow_directory if metadata_type is metadata_registry.WORKFLOWS
+                      else os.path.join(source_directory, metadata_type.name))
+    return os.path.join(type_directory, parent_name, tag, metadata_type.separated_filename(tag, full_name))
+
+
+def find_destructive_conflicts(manifest, destructive_types, workflow_directory=WORKFLOW_DIRECTORY,
+                               source_directory=SOURCE_DIRECTORY):
+    """Return the components deleted by the destructive packages that the packages to deploy would deploy again.
+
+    A deleted child of an object type is deployed again if its parent object is combined while its separated
+    file still exists.
+    """
+    conflicts = []
+    for metadata_name, members in sorted(destructive_types.items()):
+        deployed_members = manifest.types.get(metadata_name, set())
+        for member in sorted(members):
+            if member in deployed_members:
+                conflicts.append(f'{metadata_name}: {member}')
+                continue
+            separated_file = find_separated_component(metadata_name, member, workflow_directory, source_directory)
+            metadata_type, _ = metadata_registry.find_package_type(metadata_name)
+            if (separated_file and member.split('.')[0] in manifest.components[metadata_type.name]
+                    and os.path.isfile(separated_file)):
+                conflicts.append(f'{metadata_name}: {member} ({separated_file})')
+    return conflicts
+
+
+def check_destructive_changes(manifest, destructive_paths, workflow_directory=WORKFLOW_DIRECTORY,
+                              source_directory=SOURCE_DIRECTORY):
+    """Validate the destructive packages against the packages to deploy and report what they delete.
+
+    Exit if a deleted component would be deployed again. Return the members of each deleted type.
+    """
+    destructive_types = read_destructive_metadata(destructive_paths)
+    conflicts = find_destructive_conflicts(manifest, destructive_types, workflow_directory, source_directory)
+    for component in conflicts:
+        logging.info('ERROR: %s is deleted by the destructive changes but deployed by the package.', component)
+    if conflicts:
+        logging.info('Remove the components from the package or delete their separated files before re-trying.')
+        sys.exit(1)
+    logging.info('The destructive changes delete %d component(s): %s',
+                 sum(len(members) for members in destructive_types.values()),
+                 ', '.join(f'{metadata_name} ({len(members)})'
+                           for metadata_name, members in sorted(destructive_types.items())) or 'none')
+    return destructive_types
+
+
+def adjust_package_file(manifest, package_path):
+    """Re-create the package.xml with the parent object of every child of an object type, like workflow rules."""
+    if manifest.parent_types == {metadata_registry.WORKFLOWS.package_type}:
+        logging.info('Adjusting the package.xml automatically to comply with Salesforce Workflow Deployments:')
+    else:
+        logging.info('Adjusting the package.xml automatically to deploy the parent objects of the %s:',
+                     ', '.join(sorted(manifest.parent_types)))
+    create_package_file(manifest.types, manifest.api_version, package_path)
+
+
+def write_adjusted_package(manifest, package_paths, output_file=None):
+    """Write the merged package to output_file, or adjust a single package that has children of object types."""
+    if output_file:
+        create_package_file(manifest.types, manifest.api_version, output_file)
     # if the package has workflows, adjust the package automatically to comply with the known Salesforce CLI bug
     # For all workflow child items, find parent workflow and re-create package.xml with the parent workflow name
-    if child_workflows:
-        package_contents = {}
-        logging.info('Adjusting the package.xml automatically to comply with Salesforce Workflow Deployments:')
-        package_contents, api_version = parse_package_file(root, package_contents)
-        create_package_file(package_contents, api_version, package_path)
+    elif manifest.parent_types and isinstance(package_paths, str):
+        adjust_package_file(manifest, package_paths)
+    elif manifest.parent_types:
+        logging.warning('WARNING: Use --output to write the merged package with the parent objects.')
+
+
+def load_component_index(index_file, manifest):
+    """Load the component index and exit if the manifest declares components that are not in it or whose
+    files were deleted."""
+    index = component_index.ComponentIndex(index_file)
+    missing = index.find_missing(manifest)
+    for component in missing:
+        logging.info('ERROR: %s is in the package but not in the component index %s.', component, index_file)
+    missing_files = index.find_missing_files(manifest)
+    for component, file_path in missing_files:
+        logging.info('ERROR: %s is in the package but %s in the component index was deleted.',
+                     component, file_path)
+    if missing or missing_files:
+        logging.info('Separate the labels and workflows again or rebuild the index before re-trying.')
+        sys.exit(1)
+    return index
+
+
+def get_engine_components(manifest):
+    """Return the components of the registered types other than labels and workflows, which the engine combines."""
+    return {name: components for name, components in manifest.components.items()
+            if components and name not in (metadata_registry.LABELS.name, metadata_registry.WORKFLOWS.name)}
+
+
+def write_deploy_zip(manifest, zip_output, label_directory=LABEL_DIRECTORY, workflow_directory=WORKFLOW_DIRECTORY,
+                     source_directory=SOURCE_DIRECTORY, index=None, destructive_paths=None):
+    """Stream the combined files of the manifest and its adjusted package.xml into a deployment zip.
+
+    zip_output is a path or a binary file object, like an io.BytesIO buffer. Nothing is written to the source tree.
+    The destructive packages are added unchanged at the root of the zip.
+    """
+    combined_files = 0
+    with deploy_zip.open_archive(zip_output) as archive:
+        if manifest.labels:
+            fragments = combine_labels.format_individual_xmls(label_directory, True, manifest.labels, index)
+            deploy_zip.write_fragments(archive, metadata_registry.LABELS.deploy_filename(),
+                                       metadata_engine.create_combined_root(metadata_registry.LABELS), fragments)
+            combined_files += 1
+        if manifest.workflows:
+            for parent_workflow_name, file_paths in combine_workflows.iter_individual_xmls(
+                    workflow_directory, True, manifest.workflows, index):
+                deploy_zip.write_fragments(archive, metadata_registry.WORKFLOWS.deploy_filename(parent_workflow_name),
+                                           metadata_engine.create_combined_root(metadata_registry.WORKFLOWS),
+                                           combine_workflows.format_object_workflows(file_paths))
+                combined_files += 1
+        engine_components = get_engine_components(manifest)
+        if engine_components:
+            for metadata_type, parent_name, root, fragments in metadata_engine.iter_combined_files(
+                    source_directory, list(engine_components), engine_components):
+                deploy_zip.write_fragments(archive, metadata_type.deploy_filename(parent_name), root, fragments)
+                combined_files += 1
+        deploy_zip.write_bytes(archive, deploy_zip.PACKAGE_FILENAME,
+                               package_to_bytes(manifest.types, manifest.api_version))
+        for destructive_path in destructive_paths or []:
+            with open(destructive_path, 'rb') as destructive_file:
+                deploy_zip.write_bytes(archive, os.path.basename(destructive_path), destructive_file.read())
+    logging.info('Wrote %d combined file(s) and the package to the deployment zip.', combined_files)
+
+
+def scan_package_metadata(package_paths, label_directory=LABEL_DIRECTORY, label_file=LABEL_FILE,
+                          workflow_directory=WORKFLOW_DIRECTORY, output_file=None, index_file=None,
+                          source_directory=SOURCE_DIRECTORY, zip_output=None, destructive_paths=None):
+    """Scan the packages and run the applicable scripts.
+
+    The adjusted package is written to output_file, or to the package itself if a single package is scanned.
+    With an index_file, the package is validated against the component index before anything is combined.
+    With a zip_output, the combined files and the adjusted package are written to a deployment zip instead,
+    and the package itself is left untouched.
+    The destructive_paths are only checked against the package and are never merged into it.
+    """
+    manifest = read_package_metadata(package_paths, source_directory)
+    index = load_component_index(index_file, manifest) if index_file else None
+    if destructive_paths:
+        check_destructive_changes(manifest, destructive_paths, workflow_directory, source_directory)
+
+    if zip_output:
+        write_deploy_zip(manifest, zip_output, label_directory, workflow_directory, source_directory, index,
+                         destructive_paths)
+        if output_file:
+            create_package_file(manifest.types, manifest.api_version, output_file)
+        return manifest
+
+    if manifest.labels:
+        combine_labels.combine_labels(label_directory, label_file, True, manifest.labels, index=index)
+    if manifest.workflows:
+        combine_workflows.combine_workflows(workflow_directory, True, manifest.workflows, index=index)
+    engine_components = get_engine_components(manifest)
+    if engine_components:
+        metadata_engine.compose(source_directory, list(engine_components), components=engine_components)
+    write_adjusted_package(manifest, package_paths, output_file)
+    return manifest
+
 
-def main(manifest):
+def main(manifests, output_file, index_file, zip_output, destructive_paths):
     """Main function."""
-    scan_package_metadata(manifest)
+    scan_package_metadata(manifests[0] if len(manifests) == 1 else manifests, output_file=output_file,
+                          index_file=index_file, zip_output=zip_output, destructive_paths=destructive_paths)
 
 
 if __name__ == '__main__':
     inputs = parse_args()
-    main(inputs.manifest)
+    metrics.configure_logging(inputs)
+    main(inputs.manifest, inputs.output, inputs.index, inputs.zip, inputs.destructive)
+    metrics.report('parse_package', inputs)
@@ -1,105 +1,98 @@
 import argparse
+import functools
 import logging
 import os
-import xml.etree.ElementTree as ET
-from xml.dom import minidom
+from collections import Counter
 
-
-ns = {'sforce': 'http://soap.sforce.com/2006/04/metadata'}
-logging.basicConfig(format='%(message)s', level=logging.DEBUG)
+import component_index
+import metadata_engine
+import metadata_registry
+import metrics
 
 
 def parse_args():
     """Function to parse command line arguments."""
     parser = argparse.ArgumentParser(description='A script to create workflows.')
     parser.add_argument('-d', '--directory', default='force-app/main/default/workflows')
+    parser.add_argument('-j', '--jobs', type=int, default=1,
+                        help='Number of worker processes used to separate the workflow files.')
+    parser.add_argument('-s', '--sync', default=False, action='store_true',
+                        help='Delete the separated files of elements that are no longer in the workflow files.')
+    parser.add_argument('--prune-missing-objects', default=False, action='store_true',
+                        help='Also delete the separated files of objects without a workflow file. Only use it after '
+                             'retrieving the workflows of every object.')
+    parser.add_argument('-i', '--index', default=None,
+                        help='Component index to update with the separated workflow elements.')
+    metrics.add_arguments(parser)
     args = parser.parse_args()
     return args
 
 
-def extract_full_name(element, namespace):
-    """Extract the full name from a given XML element."""
-    full_name_element = element.find('sforce:fullName', namespace)
-    return full_name_element.text if full_name_element is not None else None
-
-
-def create_xml_file(label, workflow_directory, parent_workflow_name, tag, full_name):
-    """Create a new XML file for a given element."""
-    # Remove the namespace prefix from the tag
-    tag_without_namespace = tag.split('}')[-1] if '}' in tag else tag
-
-    subfolder = os.path.join(workflow_directory, parent_workflow_name, tag_without_namespace)
-    os.makedirs(subfolder, exist_ok=True)  # Ensure the subfolder exists
-
-    output_filename = f'{subfolder}/{full_name}.{tag_without_namespace}-meta.xml'
-
-    # Remove the namespace prefix from the element tags
-    for element in label.iter():
-        if '}' in element.tag:
-            element.tag = element.tag.split('}')[1]
-
-    xml_header = '<?xml version="1.0" encoding="UTF-8"?>\n'
-    xml_content = ET.tostring(label, encoding='utf-8').decode('utf-8')
-    dom = minidom.parseString(xml_content)
-    formatted_xml = dom.toprettyxml(indent='    ')
-
-    # Remove extra new lines
-    formatted_xml = '\n'.join(line for line in formatted_xml.split('\n') if line.strip())
-
-    # Remove existing XML declaration
-    formatted_xml = '\n'.join(line for line in formatted_xml.split('\n') if not line.strip().startswith('<?xml'))
-
-    with open(output_filename, 'wb') as file:
-        file.write(xml_header.encode('utf-8'))
-        file.write(formatted_xml.encode('utf-8'))
-
-    logging.info('Saved %s element content to %s', tag, output_filename)
-
-
-def process_workflow_file(workflow_directory, filename):
-    """Process a single workflow file and extract elements."""
-    # Extract the parent workflow name from the XML file name
-    parent_workflow_name = filename.split('.')[0]
-    workflow_file_path = os.path.join(workflow_directory, filename)
-
-    try:
-        tree = ET.parse(workflow_file_path)
-        root = tree.getroot()
-    except FileNotFoundError:
-        logging.info("Error: XML file '%s' not found.", workflow_file_path)
-        return
-    except ET.ParseError:
-        logging.info("Error: Unable to parse the XML file.")
-        return
-
-
-    # Extract all unique XML tags dynamically
-    xml_tags = {elem.tag for elem in root.iter() if '}' in elem.tag}
-
-    # Iterate through the dynamically extracted XML tags
-    for tag in xml_tags:
-        for _, label in enumerate(root.findall(tag, ns)):
-            full_name = extract_full_name(label, ns)
-
-            if full_name:
-                create_xml_file(label, workflow_directory, parent_workflow_name, tag, full_name)
-            else:
-                logging.info('Skipping %s element without fullName', tag)
-
-
-def separate_workflows(workflow_directory):
-    """Separate workflows into individual XML files."""
-    # Iterate through the directory to process files
-    for filename in os.listdir(workflow_directory):
-        if filename.endswith(".workflow-meta.xml"):
-            process_workflow_file(workflow_directory, filename)
-
-
-def main(workflow_directory):
+def process_workflow_file(workflow_directory, filename, sync=False, index=False):
+    """Separate a single workflow file and return the counts of written, unchanged, skipped and deleted files with
+    the component index updates.
+
+    With sync, separated files of elements that are no longer in the workflow file are deleted.
+    Index updates are only recorded if index is True.
+    """
+    index_updates = component_index.IndexUpdates() if index else None
+    counts = metadata_engine.decompose_file(metadata_registry.WORKFLOWS, workflow_directory, filename, sync,
+                                            index_updates)
+    # The folders of an object that could not be read are not recorded, so the index is not trusted for it
+    if index_updates is not None and not counts['failed']:
+        parent_workflow_name = metadata_registry.WORKFLOWS.parent_name(filename)
+        index_updates.record_folders(parent_workflow_name, os.path.join(workflow_directory, parent_workflow_name))
+    return counts, index_updates
+
+
+def prune_workflow_objects(workflow_directory, filenames, index=None):
+    """Delete the separated files of the objects without a workflow file and return how many were deleted.
+
+    The objects are also removed from the component index, so they are not combined again.
+    """
+    deleted = metadata_engine.prune_separated_objects(metadata_registry.WORKFLOWS, workflow_directory, index)
+    if index is not None:
+        parent_workflow_names = {metadata_registry.WORKFLOWS.parent_name(filename) for filename in filenames}
+        for parent_workflow_name in sorted(index.get_workflow_parents() - parent_workflow_names):
+            index.remove_workflow(parent_workflow_name)
+    return deleted
+
+
+def separate_workflows(workflow_directory, jobs=1, sync=False, index_file=None, prune_missing_objects=False):
+    """Separate workflows into individual XML files and return the counts of written, unchanged, skipped and
+    deleted files.
+
+    With prune_missing_objects, the separated files of objects without a workflow file are deleted as well.
+    With an index file, the component index is updated with the separated workflow elements.
+    """
+    with metrics.phase('discovery'):
+        filenames = sorted(filename for filename in os.listdir(workflow_directory)
+                           if metadata_registry.WORKFLOWS.parent_name(filename) is not None)
+
+    process_file = functools.partial(process_workflow_file, workflow_directory, sync=sync, index=bool(index_file))
+    file_results = metadata_engine.map_in_workers(process_file, filenames, jobs)
+
+    counts = sum((file_counts for file_counts, _ in file_results), Counter())
+    index = component_index.ComponentIndex(index_file) if index_file else None
+    if index is not None:
+        for _, index_updates in file_results:
+            index_updates.apply(index)
+    if prune_missing_objects:
+        counts['deleted'] += prune_workflow_objects(workflow_directory, filenames, index)
+    if index is not None:
+        index.save()
+    logging.info('Workflow files written: %d, unchanged: %d, skipped: %d, deleted: %d',
+                 counts['written'], counts['unchanged'], counts['skipped'], counts['deleted'])
+    return counts
+
+
+def main(workflow_directory, jobs, sync, index_file, prune_missing_objects):
     """Main function."""
-    separate_workflows(workflow_directory)
+    separate_workflows(workflow_directory, jobs, sync, index_file, prune_missing_objects)
 
 
 if __name__ == '__main__':
     inputs = parse_args()
-    main(inputs.directory)
+    metrics.configure_logging(inputs)
+    main(inputs.directory, inputs.jobs, inputs.sync, inputs.index, inputs.prune_missing_objects)
+    metrics.report('separate_workflows', inputs)
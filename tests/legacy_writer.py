@@ -0,0 +1,13 @@
+"""The ET.tostring -> minidom.toprettyxml pipeline the scripts used before xml_writer, kept as the reference."""
+import xml.etree.ElementTree as ET
+from xml.dom import minidom
+
+
+def legacy_xml_bytes(root):
+    """Return the root element formatted like the original scripts wrote it."""
+    xml_header = '<?xml version="1.0" encoding="UTF-8"?>\n'
+    xml_str = ET.tostring(root, encoding='utf-8').decode('utf-8')
+    formatted_xml = minidom.parseString(xml_str).toprettyxml(indent="    ")
+    formatted_xml = '\n'.join(line for line in formatted_xml.split('\n') if line.strip())
+    formatted_xml = '\n'.join(line for line in formatted_xml.split('\n') if not line.strip().startswith('<?xml'))
+    return xml_header.encode('utf-8') + formatted_xml.encode('utf-8')
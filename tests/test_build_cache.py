@@ -0,0 +1,95 @@
+"""Tests of the cache of the incremental combine workflows script."""
+import os
+import shutil
+
+import pytest
+
+import build_cache
+import combine_workflows
+from tests.test_golden import WORKFLOW_DIRECTORY
+
+OBJECTS = ['Account', 'Case']
+RULE_FILE = os.path.join('rules', 'BooleanFilter.rules-meta.xml')
+
+
+@pytest.fixture
+def workflow_directory(tmp_path):
+    """Copy the separated golden workflows of Case for each object, without their combined files."""
+    for parent_workflow_name in OBJECTS:
+        shutil.copytree(os.path.join(WORKFLOW_DIRECTORY, 'Case'), tmp_path / parent_workflow_name)
+    return tmp_path
+
+
+def combine(workflow_directory, manifest=False, package_workflows=None):
+    """Combine the workflows with the cache and return the rebuilt and skipped objects."""
+    objects = combine_workflows.iter_individual_xmls(str(workflow_directory), manifest, package_workflows)
+    rebuilt, skipped = combine_workflows.combine_cached_workflows(str(workflow_directory), objects, manifest,
+                                                                  str(workflow_directory / 'cache.json'))
+    return sorted(rebuilt), sorted(skipped)
+
+
+def test_unchanged_tree_skips_every_object(workflow_directory):
+    assert combine(workflow_directory) == (OBJECTS, [])
+    assert combine(workflow_directory) == ([], OBJECTS)
+
+
+def test_touched_file_is_skipped(workflow_directory):
+    combine(workflow_directory)
+    os.utime(workflow_directory / 'Case' / RULE_FILE)
+    assert combine(workflow_directory) == ([], OBJECTS)
+
+
+def test_renamed_rule_rebuilds_its_object(workflow_directory):
+    combine(workflow_directory)
+    os.rename(workflow_directory / 'Case' / RULE_FILE, workflow_directory / 'Case' / 'rules' / 'Renamed.rules-meta.xml')
+    assert combine(workflow_directory) == (['Case'], ['Account'])
+
+
+def test_added_rule_rebuilds_its_object(workflow_directory):
+    combine(workflow_directory)
+    shutil.copyfile(workflow_directory / 'Case' / RULE_FILE, workflow_directory / 'Account' / 'rules' /
+                    'Copy.rules-meta.xml')
+    assert combine(workflow_directory) == (['Account'], ['Case'])
+    with open(combine_workflows.get_workflow_filename(str(workflow_directory), 'Account'), encoding='utf-8') as file:
+        assert file.read().count('<fullName>BooleanFilter</fullName>') == 2
+
+
+def test_deleted_rule_rebuilds_its_object(workflow_directory):
+    combine(workflow_directory)
+    os.remove(workflow_directory / 'Case' / RULE_FILE)
+    assert combine(workflow_directory) == (['Case'], ['Account'])
+    with open(combine_workflows.get_workflow_filename(str(workflow_directory), 'Case'), encoding='utf-8') as file:
+        assert '<fullName>BooleanFilter</fullName>' not in file.read()
+
+
+def test_edited_combined_file_is_rebuilt(workflow_directory):
+    combine(workflow_directory)
+    workflow_filename = combine_workflows.get_workflow_filename(str(workflow_directory), 'Account')
+    with open(workflow_filename, 'rb') as file:
+        content = file.read()
+    with open(workflow_filename, 'wb') as file:
+        file.write(content.replace(b'BooleanFilter', b'EditedByHand'))
+    assert combine(workflow_directory) == (['Account'], ['Case'])
+    with open(workflow_filename, 'rb') as file:
+        assert file.read() == content
+
+
+def test_deleted_combined_file_is_rebuilt(workflow_directory):
+    combine(workflow_directory)
+    os.remove(combine_workflows.get_workflow_filename(str(workflow_directory), 'Case'))
+    assert combine(workflow_directory) == (['Case'], ['Account'])
+
+
+def test_manifest_run_keeps_other_objects(workflow_directory):
+    combine(workflow_directory)
+    os.remove(workflow_directory / 'Case' / RULE_FILE)
+    assert combine(workflow_directory, True, ['Case']) == (['Case'], [])
+    assert set(build_cache.load_cache(str(workflow_directory / 'cache.json'))) == set(OBJECTS)
+    assert combine(workflow_directory) == ([], OBJECTS)
+
+
+def test_full_run_drops_objects_without_sources(workflow_directory):
+    combine(workflow_directory)
+    shutil.rmtree(workflow_directory / 'Account')
+    assert combine(workflow_directory) == ([], ['Case'])
+    assert set(build_cache.load_cache(str(workflow_directory / 'cache.json'))) == {'Case'}
@@ -0,0 +1,122 @@
+"""Tests of the mapping of changed paths to the components of the delta package."""
+import os
+import shutil
+
+import pytest
+
+import component_index
+import delta_package
+from tests.test_golden import WORKFLOW_DIRECTORY
+
+LABELS = 'force-app/main/default/labels'
+WORKFLOWS = 'force-app/main/default/workflows'
+
+
+@pytest.mark.parametrize('path, component', [
+    (f'{LABELS}/quoteAuto.label-meta.xml', ('CustomLabel', 'quoteAuto')),
+    ('quoteAuto.label-meta.xml', ('CustomLabel', 'quoteAuto')),
+    (f'{WORKFLOWS}/Case/rules/BooleanFilter.rules-meta.xml', ('WorkflowRule', 'Case.BooleanFilter')),
+    (f'{WORKFLOWS}/Case/rules/Custom Rule1.rules-meta.xml', ('WorkflowRule', 'Case.Custom Rule1')),
+    (f'{WORKFLOWS}/Case/fieldUpdates/Field_Update.fieldUpdates-meta.xml', ('WorkflowFieldUpdate', 'Case.Field_Update')),
+    (f'{WORKFLOWS}/Case/alerts/Another_alert.alerts-meta.xml', ('WorkflowAlert', 'Case.Another_alert')),
+    (f'{WORKFLOWS}/Case.workflow-meta.xml', ('Workflow', 'Case')),
+    ('workflows/Case/tasks/Task.tasks-meta.xml', ('WorkflowTask', 'Case.Task')),
+    # Windows separators
+    ('force-app\\main\\default\\workflows\\Case\\rules\\BooleanFilter.rules-meta.xml',
+     ('WorkflowRule', 'Case.BooleanFilter')),
+    ('force-app\\main\\default\\labels\\quoteAuto.label-meta.xml', ('CustomLabel', 'quoteAuto')),
+    # The last workflows folder of the path is used
+    ('workflows/force-app/main/default/workflows/Case/rules/R.rules-meta.xml', ('WorkflowRule', 'Case.R')),
+])
+def test_map_changed_path(path, component):
+    assert delta_package.map_changed_path(path) == component
+
+
+@pytest.mark.parametrize('path', [
+    f'{WORKFLOWS}/Case/unknownFolder/Element.unknownFolder-meta.xml',
+    f'{WORKFLOWS}/Case/rules/BooleanFilter.fieldUpdates-meta.xml',
+    f'{WORKFLOWS}/Case/rules/README.md',
+    f'{WORKFLOWS}/Case/rules/nested/R.rules-meta.xml',
+    f'{WORKFLOWS}/Case.workflow',
+    f'{WORKFLOWS}/README.md',
+    'force-app/main/default/classes/MyClass.cls',
+    'force-app/main/default/objects/Case/Case.object-meta.xml',
+    'manifest/package.xml',
+])
+def test_map_changed_path_ignores_other_files(path):
+    assert delta_package.map_changed_path(path) is None
+
+
+@pytest.fixture
+def source_directory(tmp_path, monkeypatch):
+    """Copy the separated golden workflows of Case and a label into a source tree and run from its root."""
+    shutil.copytree(os.path.join(WORKFLOW_DIRECTORY, 'Case'), tmp_path / WORKFLOWS / 'Case')
+    (tmp_path / LABELS).mkdir(parents=True)
+    (tmp_path / LABELS / 'quoteAuto.label-meta.xml').write_text('<CustomLabel/>', encoding='utf-8')
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
+
+
+def test_build_delta_manifest(source_directory):
+    manifest = delta_package.build_delta_manifest([
+        f'{LABELS}/quoteAuto.label-meta.xml',
+        f'{WORKFLOWS}/Case/rules/BooleanFilter.rules-meta.xml',
+        f'{WORKFLOWS}/Case/alerts/Another_alert.alerts-meta.xml',
+        'force-app/main/default/classes/MyClass.cls',
+    ], WORKFLOWS, '59.0')
+    assert manifest.types == {'CustomLabel': {'quoteAuto'}, 'Workflow': {'Case'}}
+    assert list(manifest.labels) == ['quoteAuto']
+    assert list(manifest.workflows) == ['Case']
+    assert manifest.api_version == '59.0'
+
+
+def test_deleted_label_is_left_out(source_directory):
+    manifest = delta_package.build_delta_manifest([f'{LABELS}/quoteManual.label-meta.xml'], WORKFLOWS)
+    assert manifest.types == {}
+    assert not manifest.labels
+
+
+def test_deleted_element_adds_its_object(source_directory):
+    os.remove(source_directory / WORKFLOWS / 'Case' / 'rules' / 'BooleanFilter.rules-meta.xml')
+    manifest = delta_package.build_delta_manifest([f'{WORKFLOWS}/Case/rules/BooleanFilter.rules-meta.xml'],
+                                                  WORKFLOWS)
+    assert manifest.types == {'Workflow': {'Case'}}
+
+
+def test_deleted_last_element_leaves_its_object_out(source_directory):
+    deleted_paths = []
+    for root, _, filenames in os.walk(source_directory / WORKFLOWS / 'Case'):
+        for filename in filenames:
+            os.remove(os.path.join(root, filename))
+            deleted_paths.append(os.path.relpath(os.path.join(root, filename), source_directory))
+    manifest = delta_package.build_delta_manifest(deleted_paths, WORKFLOWS)
+    assert manifest.types == {}
+    assert not manifest.workflows
+
+
+def test_deleted_object_folder_leaves_its_object_out(source_directory):
+    shutil.rmtree(source_directory / WORKFLOWS / 'Case')
+    manifest = delta_package.build_delta_manifest([f'{WORKFLOWS}/Case/rules/BooleanFilter.rules-meta.xml'],
+                                                  WORKFLOWS)
+    assert manifest.types == {}
+
+
+def test_create_delta_package_combines_without_deleted_element(source_directory):
+    os.remove(source_directory / WORKFLOWS / 'Case' / 'rules' / 'BooleanFilter.rules-meta.xml')
+    delta_package.create_delta_package([f'{WORKFLOWS}/Case/rules/BooleanFilter.rules-meta.xml'], 'package.xml',
+                                       '59.0', LABELS, f'{LABELS}/CustomLabels.labels-meta.xml', WORKFLOWS)
+    combined = (source_directory / WORKFLOWS / 'Case.workflow-meta.xml').read_text(encoding='utf-8')
+    assert '<fullName>BooleanFilter</fullName>' not in combined
+    assert '<fullName>IsChangedFunctionRule</fullName>' in combined
+    assert '<members>Case</members>' in (source_directory / 'package.xml').read_text(encoding='utf-8')
+
+
+def test_create_delta_package_with_stale_index(source_directory):
+    component_index.build_index('index.json', LABELS, WORKFLOWS)
+    os.remove(source_directory / WORKFLOWS / 'Case' / 'rules' / 'BooleanFilter.rules-meta.xml')
+    delta_package.create_delta_package([f'{WORKFLOWS}/Case/rules/BooleanFilter.rules-meta.xml'], 'package.xml',
+                                       '59.0', LABELS, f'{LABELS}/CustomLabels.labels-meta.xml', WORKFLOWS,
+                                       'index.json')
+    combined = (source_directory / WORKFLOWS / 'Case.workflow-meta.xml').read_text(encoding='utf-8')
+    assert '<fullName>BooleanFilter</fullName>' not in combined
+    assert '<fullName>IsChangedFunctionRule</fullName>' in combined
@@ -0,0 +1,170 @@
+"""Golden-output tests of the XML writer and the scripts that write the separated and combined files."""
+import copy
+import io
+import os
+import random
+import shutil
+import xml.etree.ElementTree as ET
+
+import pytest
+
+import combine_labels
+import combine_workflows
+import separate_labels
+import separate_workflows
+import xml_backend
+import xml_writer
+from tests.legacy_writer import legacy_xml_bytes
+
+GOLDEN_DIRECTORY = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'golden')
+LABEL_DIRECTORY = os.path.join(GOLDEN_DIRECTORY, 'labels')
+LABEL_FILE = 'CustomLabels.labels-meta.xml'
+WORKFLOW_DIRECTORY = os.path.join(GOLDEN_DIRECTORY, 'workflows')
+WORKFLOW_FILE = 'Case.workflow-meta.xml'
+XML_DIRECTORY = os.path.join(GOLDEN_DIRECTORY, 'xml')
+XML_CASES = sorted(filename[:-len('.input.xml')] for filename in os.listdir(XML_DIRECTORY)
+                   if filename.endswith('.input.xml'))
+
+
+def read_bytes(file_path):
+    """Return the content of a file."""
+    with open(file_path, 'rb') as file:
+        return file.read()
+
+
+def list_files(directory):
+    """Return the content of every file under a directory by relative path."""
+    files = {}
+    for root, _, filenames in os.walk(directory):
+        for filename in filenames:
+            file_path = os.path.join(root, filename)
+            files[os.path.relpath(file_path, directory)] = read_bytes(file_path)
+    return files
+
+
+def parse_input(case):
+    """Parse the input of an XML case without namespaces with the XML backend, like the separate scripts do."""
+    return xml_backend.strip_namespaces(xml_backend.parse(os.path.join(XML_DIRECTORY, f'{case}.input.xml')))
+
+
+@pytest.fixture(params=xml_backend.BACKENDS)
+def backend(request, monkeypatch):
+    """Run a test with each XML backend, skipping lxml when it is not installed."""
+    previous_backend = xml_backend.BACKEND
+    try:
+        xml_backend.set_backend(request.param)
+    except ImportError:
+        pytest.skip(f'{request.param} is not installed')
+    monkeypatch.setenv(xml_backend.BACKEND_VARIABLE, request.param)
+    yield request.param
+    xml_backend.set_backend(previous_backend)
+
+
+@pytest.mark.parametrize('case', XML_CASES)
+def test_xml_to_bytes_matches_golden(backend, case):
+    expected = read_bytes(os.path.join(XML_DIRECTORY, f'{case}.expected.xml'))
+    assert xml_writer.xml_to_bytes(parse_input(case)) == expected
+
+
+@pytest.mark.parametrize('case', XML_CASES)
+def test_write_xml_matches_golden(backend, case):
+    expected = read_bytes(os.path.join(XML_DIRECTORY, f'{case}.expected.xml'))
+    stream = io.StringIO()
+    xml_writer.write_xml(parse_input(case), stream)
+    assert stream.getvalue().encode('utf-8') == expected
+
+
+@pytest.mark.parametrize('case', XML_CASES)
+def test_golden_matches_legacy_pipeline(case):
+    expected = read_bytes(os.path.join(XML_DIRECTORY, f'{case}.expected.xml'))
+    root = xml_backend.strip_namespaces(ET.parse(os.path.join(XML_DIRECTORY, f'{case}.input.xml')).getroot())
+    assert legacy_xml_bytes(root) == expected
+
+
+def test_separate_labels_matches_golden(backend, tmp_path):
+    shutil.copyfile(os.path.join(LABEL_DIRECTORY, LABEL_FILE), tmp_path / LABEL_FILE)
+    separate_labels.separate_labels(str(tmp_path / LABEL_FILE))
+    assert list_files(tmp_path) == list_files(LABEL_DIRECTORY)
+
+
+def test_combine_labels_matches_golden(backend, tmp_path):
+    for filename in os.listdir(LABEL_DIRECTORY):
+        if filename != LABEL_FILE:
+            shutil.copyfile(os.path.join(LABEL_DIRECTORY, filename), tmp_path / filename)
+    # The package order is kept, unlike the directory order of a full run
+    combine_labels.combine_labels(str(tmp_path), str(tmp_path / LABEL_FILE), True, ['quoteAuto', 'quoteManual'])
+    assert read_bytes(tmp_path / LABEL_FILE) == read_bytes(os.path.join(LABEL_DIRECTORY, LABEL_FILE))
+
+
+def test_separate_workflows_matches_golden(backend, tmp_path):
+    shutil.copyfile(os.path.join(WORKFLOW_DIRECTORY, WORKFLOW_FILE), tmp_path / WORKFLOW_FILE)
+    separate_workflows.separate_workflows(str(tmp_path))
+    assert list_files(tmp_path) == list_files(WORKFLOW_DIRECTORY)
+
+
+def test_combine_workflows_matches_golden(backend, tmp_path):
+    shutil.copytree(os.path.join(WORKFLOW_DIRECTORY, 'Case'), tmp_path / 'Case')
+    combine_workflows.combine_workflows(str(tmp_path), False, None)
+    assert list_files(tmp_path) == list_files(WORKFLOW_DIRECTORY)
+
+
+TEXT_PIECES = ['', ' ', '\n', '\n\n', '  \n  ', 'a', 'b&c', '<x>', '"q"', "it's", '\r\n', '\r', '\t', '\xa0', 'é',
+               'line1\n\nline2', ' lead', 'trail ']
+ATTRIBUTE_NAMES = ['k', 'name', '{http://www.w3.org/2001/XMLSchema-instance}nil', '{urn:a}x',
+                   '{http://www.w3.org/XML/1998/namespace}lang']
+ATTRIBUTE_VALUES = ['v', 'true', 'a & b', '"quoted"', '<tag>', "it's"]
+
+
+def random_text(rng):
+    """Return random text with whitespace and characters to escape, or None."""
+    return ''.join(rng.choice(TEXT_PIECES) for _ in range(rng.randint(0, 4))) if rng.random() < 0.7 else None
+
+
+def random_element(rng, depth=0):
+    """Build a random tree with mixed content, attributes and empty elements."""
+    element = ET.Element(rng.choice(['a', 'fullName', 'rules', 'x']))
+    for _ in range(rng.choice([0, 0, 0, 1, 2])):
+        element.set(rng.choice(ATTRIBUTE_NAMES), rng.choice(ATTRIBUTE_VALUES))
+    element.text = random_text(rng)
+    if depth < 4:
+        for _ in range(rng.choice([0, 0, 1, 2, 3])):
+            child = random_element(rng, depth + 1)
+            child.tail = random_text(rng)
+            element.append(child)
+    return element
+
+
+@pytest.mark.parametrize('chunk_lines', [1, 3, xml_writer.CHUNK_LINES])
+def test_xml_to_bytes_matches_legacy_pipeline(monkeypatch, chunk_lines):
+    monkeypatch.setattr(xml_writer, 'CHUNK_LINES', chunk_lines)
+    for seed in range(2000):
+        root = random_element(random.Random(seed))
+        assert xml_writer.xml_to_bytes(root) == legacy_xml_bytes(copy.deepcopy(root)), f'seed {seed}'
+
+
+def test_merged_fragments_match_legacy_pipeline():
+    for seed in range(2000):
+        rng = random.Random(seed)
+        children = [random_element(rng, 1) for _ in range(rng.randint(0, 4))]
+        for child in children:
+            # Namespaced attributes are declared on each fragment instead of the root
+            for element in child.iter():
+                for name in [name for name in element.attrib if name.startswith('{')]:
+                    del element.attrib[name]
+        legacy_root = ET.Element('Workflow', xmlns='http://soap.sforce.com/2006/04/metadata')
+        for child in copy.deepcopy(children):
+            merged = ET.SubElement(legacy_root, child.tag)
+            merged.extend(list(child))
+        fragments = ('\n'.join(xml_writer.format_merged_element(child, xml_writer.INDENT)) for child in children)
+        root = ET.Element('Workflow', xmlns='http://soap.sforce.com/2006/04/metadata')
+        assert xml_writer.fragments_to_bytes(root, fragments) == legacy_xml_bytes(legacy_root), f'seed {seed}'
+
+
+def test_merged_fragment_declares_its_namespaces():
+    child = ET.fromstring('<fieldUpdates xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance">'
+                          '<fullName>Empty</fullName><literalValue xsi:nil="true"/></fieldUpdates>')
+    fragment = '\n'.join(xml_writer.format_merged_element(child, xml_writer.INDENT))
+    root = ET.Element('Workflow', xmlns='http://soap.sforce.com/2006/04/metadata')
+    combined = ET.fromstring(xml_writer.fragments_to_bytes(root, [fragment]))
+    literal_value = combined.find('{*}fieldUpdates/{*}literalValue')
+    assert literal_value.get('{http://www.w3.org/2001/XMLSchema-instance}nil') == 'true'
@@ -0,0 +1,83 @@
+"""Tests of the metadata engine with the registered types other than labels and workflows."""
+import os
+
+import pytest
+
+import metadata_engine
+import metadata_registry
+import parse_package
+from tests.test_golden import list_files, read_bytes
+from tests.test_sync import SHARING_RULES, separate_sharing_rules
+
+SHARING_DIRECTORY = metadata_registry.SHARING_RULES.name
+
+
+def test_sharing_rules_round_trip(tmp_path):
+    directory = separate_sharing_rules(tmp_path, ('Account', 'Lead'))
+    assert sorted(list_files(directory / 'Account')) == [
+        os.path.join('sharingCriteriaRules', 'Partners.sharingCriteriaRules-meta.xml'),
+        os.path.join('sharingOwnerRules', 'Managers.sharingOwnerRules-meta.xml'),
+    ]
+    for parent_name in ('Account', 'Lead'):
+        os.remove(directory / f'{parent_name}.sharingRules-meta.xml')
+
+    type_counts = metadata_engine.compose(str(tmp_path), [SHARING_DIRECTORY])
+
+    assert type_counts[SHARING_DIRECTORY]['combined'] == 4
+    for parent_name in ('Account', 'Lead'):
+        assert read_bytes(directory / f'{parent_name}.sharingRules-meta.xml') == SHARING_RULES.encode('utf-8')
+
+
+def test_sharing_rules_compose_only_package_objects(tmp_path):
+    directory = separate_sharing_rules(tmp_path, ('Account', 'Lead'))
+    os.remove(directory / 'Lead.sharingRules-meta.xml')
+    separated_files = list_files(directory / 'Lead')
+
+    metadata_engine.compose(str(tmp_path), components={SHARING_DIRECTORY: {'Account': True}})
+
+    assert not (directory / 'Lead.sharingRules-meta.xml').exists()
+    assert list_files(directory / 'Lead') == separated_files
+
+
+@pytest.fixture
+def source_directory(tmp_path):
+    """Create the separated folder of the sharing criteria rules of Account only."""
+    (tmp_path / SHARING_DIRECTORY / 'Account' / 'sharingCriteriaRules').mkdir(parents=True)
+    return tmp_path
+
+
+def test_separated_rule_is_replaced_by_its_object(source_directory):
+    manifest = parse_package.PackageManifest(str(source_directory))
+    manifest.add_members('SharingCriteriaRule', ['Account.Partners'])
+    assert manifest.types == {'SharingRules': {'Account'}}
+    assert manifest.parent_types == {'SharingRules'}
+    assert manifest.components[SHARING_DIRECTORY] == {'Account': True}
+
+
+@pytest.mark.parametrize('metadata_name, member', [
+    # No separated folder for the object
+    ('SharingCriteriaRule', 'Lead.Partners'),
+    # No separated folder for the type of the object
+    ('SharingOwnerRule', 'Account.Managers'),
+])
+def test_rule_without_separated_folder_is_kept(source_directory, metadata_name, member):
+    manifest = parse_package.PackageManifest(str(source_directory))
+    manifest.add_members(metadata_name, [member])
+    assert manifest.types == {metadata_name: {member}}
+    assert not manifest.parent_types
+    assert not manifest.components[SHARING_DIRECTORY]
+
+
+def test_separated_and_other_rules_are_split(source_directory):
+    manifest = parse_package.PackageManifest(str(source_directory))
+    manifest.add_members('SharingCriteriaRule', ['Account.Partners', 'Lead.Partners'])
+    assert manifest.types == {'SharingRules': {'Account'}, 'SharingCriteriaRule': {'Lead.Partners'}}
+    assert manifest.components[SHARING_DIRECTORY] == {'Account': True}
+
+
+def test_workflow_rule_is_always_replaced(source_directory):
+    manifest = parse_package.PackageManifest(str(source_directory))
+    manifest.add_members('WorkflowRule', ['Case.BooleanFilter'])
+    assert manifest.types == {'Workflow': {'Case'}}
+    assert manifest.parent_types == {'Workflow'}
+    assert manifest.workflows == {'Case': True}
@@ -0,0 +1,29 @@
+"""Tests of the metrics shared by the scripts and the benchmark."""
+import os
+import subprocess
+import sys
+
+import metrics
+
+PACKAGE_DIRECTORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MEGABYTE = 1024 * 1024
+
+
+def measure_child_peak(allocated_megabytes):
+    """Return the peak RSS reported by a new process that allocates memory, like a benchmark operation."""
+    code = ('import metrics\n'
+            f'data = bytearray({allocated_megabytes * MEGABYTE})\n'
+            'print(metrics.peak_rss_kb())\n')
+    result = subprocess.run([sys.executable, '-c', code], cwd=PACKAGE_DIRECTORY, check=True, capture_output=True,
+                            text=True)
+    return int(result.stdout)
+
+
+def test_operations_report_their_own_peak_rss():
+    # The parent peak must not be reported by the operations it starts
+    parent_data = bytearray(300 * MEGABYTE)
+    small_peak = measure_child_peak(0)
+    large_peak = measure_child_peak(150)
+    assert metrics.peak_rss_kb() >= len(parent_data) // 1024
+    assert small_peak < 100 * 1024
+    assert large_peak - small_peak > 100 * 1024
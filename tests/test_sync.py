@@ -0,0 +1,249 @@
+"""Tests of the separate scripts deleting the separated files of removed components with --sync."""
+import json
+import os
+import re
+import shutil
+
+import component_index
+import metadata_engine
+import metadata_registry
+import separate_labels
+import separate_workflows
+from tests.test_golden import LABEL_DIRECTORY, LABEL_FILE, WORKFLOW_DIRECTORY, WORKFLOW_FILE, list_files
+
+# A time in the past, so a rewritten file gets a new modification time
+OLD_MTIME_NS = 1_600_000_000 * 10 ** 9
+SHARING_RULES = '''<?xml version="1.0" encoding="UTF-8"?>
+<SharingRules xmlns="http://soap.sforce.com/2006/04/metadata">
+    <sharingCriteriaRules>
+        <fullName>Partners</fullName>
+        <accessLevel>Read</accessLevel>
+    </sharingCriteriaRules>
+    <sharingOwnerRules>
+        <fullName>Managers</fullName>
+        <accessLevel>Edit</accessLevel>
+    </sharingOwnerRules>
+</SharingRules>'''
+
+
+def read_text(file_path):
+    """Return the text of a file."""
+    with open(file_path, 'r', encoding='utf-8') as file:
+        return file.read()
+
+
+def write_text(file_path, text):
+    """Write the text of a file."""
+    with open(file_path, 'w', encoding='utf-8') as file:
+        file.write(text)
+
+
+def remove_element(text, tag, full_name):
+    """Remove the element of a component from the text of a combined file."""
+    pattern = rf'\s*<{tag}>\s*<fullName>{re.escape(full_name)}</fullName>.*?</{tag}>'
+    result, count = re.subn(pattern, '', text, count=1, flags=re.DOTALL)
+    assert count == 1
+    return result
+
+
+def truncate_after(text, tag, full_name):
+    """Cut the text of a combined file in the middle of the element following a component."""
+    end = re.search(rf'<fullName>{re.escape(full_name)}</fullName>.*?</{tag}>', text, flags=re.DOTALL).end()
+    return f'{text[:end]}\n    <{tag}>\n        <fullName>Broken'
+
+
+def set_old_mtimes(directory):
+    """Set an old modification time on every file under a directory and return the times by relative path."""
+    mtimes = {}
+    for root, _, filenames in os.walk(directory):
+        for filename in filenames:
+            file_path = os.path.join(root, filename)
+            os.utime(file_path, ns=(OLD_MTIME_NS, OLD_MTIME_NS))
+            mtimes[os.path.relpath(file_path, directory)] = OLD_MTIME_NS
+    return mtimes
+
+
+def get_mtimes(directory, names):
+    """Return the modification times of files under a directory by relative path."""
+    return {name: os.stat(os.path.join(directory, name)).st_mtime_ns for name in names}
+
+
+def read_index(index_file):
+    """Return the components of a saved component index."""
+    with open(index_file, 'r', encoding='utf-8') as file:
+        return json.load(file)['components']
+
+
+def separate_golden_labels(tmp_path, index_file=None):
+    """Separate the golden labels file in a temporary folder and return the path of the labels file."""
+    label_file = str(tmp_path / LABEL_FILE)
+    shutil.copyfile(os.path.join(LABEL_DIRECTORY, LABEL_FILE), label_file)
+    separate_labels.separate_labels(label_file, index_file=index_file)
+    return label_file
+
+
+def separate_golden_workflows(tmp_path, objects=('Case',), index_file=None):
+    """Separate the golden workflow file for each object in a temporary folder and return the folder."""
+    for parent_workflow_name in objects:
+        shutil.copyfile(os.path.join(WORKFLOW_DIRECTORY, WORKFLOW_FILE),
+                        tmp_path / f'{parent_workflow_name}.workflow-meta.xml')
+    separate_workflows.separate_workflows(str(tmp_path), index_file=index_file)
+    return str(tmp_path)
+
+
+def test_sync_deletes_removed_label_and_keeps_the_others(tmp_path):
+    label_file = separate_golden_labels(tmp_path)
+    mtimes = set_old_mtimes(tmp_path)
+    write_text(label_file, remove_element(read_text(label_file), 'labels', 'quoteManual'))
+
+    counts = separate_labels.separate_labels(label_file, sync=True)
+
+    assert not (tmp_path / 'quoteManual.label-meta.xml').exists()
+    assert counts['deleted'] == 1 and counts['written'] == 0 and counts['unchanged'] == 1
+    assert get_mtimes(tmp_path, ['quoteAuto.label-meta.xml']) == {'quoteAuto.label-meta.xml':
+                                                                  mtimes['quoteAuto.label-meta.xml']}
+
+
+def test_labels_without_sync_are_kept(tmp_path):
+    label_file = separate_golden_labels(tmp_path)
+    write_text(label_file, remove_element(read_text(label_file), 'labels', 'quoteManual'))
+    separate_labels.separate_labels(label_file)
+    assert (tmp_path / 'quoteManual.label-meta.xml').exists()
+
+
+def test_sync_with_parse_error_deletes_no_label(tmp_path):
+    label_file = separate_golden_labels(tmp_path)
+    before = set(os.listdir(tmp_path))
+    write_text(label_file, truncate_after(read_text(label_file), 'labels', 'quoteAuto'))
+
+    counts = separate_labels.separate_labels(label_file, sync=True)
+
+    assert counts['deleted'] == 0
+    assert set(os.listdir(tmp_path)) == before
+
+
+def test_sync_removes_deleted_labels_from_index(tmp_path):
+    index_file = str(tmp_path / 'index.json')
+    label_file = separate_golden_labels(tmp_path, index_file)
+    assert set(read_index(index_file)[component_index.LABEL_TYPE]) == {'quoteAuto', 'quoteManual'}
+    write_text(label_file, remove_element(read_text(label_file), 'labels', 'quoteManual'))
+
+    separate_labels.separate_labels(label_file, sync=True, index_file=index_file)
+
+    assert set(read_index(index_file)[component_index.LABEL_TYPE]) == {'quoteAuto'}
+
+
+def test_sync_deletes_removed_rule_and_keeps_the_others(tmp_path):
+    workflow_directory = separate_golden_workflows(tmp_path)
+    rule_file = os.path.join('Case', 'rules', 'BooleanFilter.rules-meta.xml')
+    mtimes = set_old_mtimes(tmp_path)
+    workflow_file = tmp_path / WORKFLOW_FILE
+    write_text(workflow_file, remove_element(read_text(workflow_file), 'rules', 'BooleanFilter'))
+
+    counts = separate_workflows.separate_workflows(workflow_directory, sync=True)
+
+    assert not (tmp_path / rule_file).exists()
+    assert counts['deleted'] == 1 and counts['written'] == 0
+    kept_files = [name for name in mtimes if name not in (rule_file, WORKFLOW_FILE)]
+    assert get_mtimes(tmp_path, kept_files) == {name: mtimes[name] for name in kept_files}
+
+
+def test_sync_with_parse_error_deletes_no_workflow_element(tmp_path):
+    workflow_directory = separate_golden_workflows(tmp_path)
+    before = list_files(tmp_path / 'Case')
+    workflow_file = tmp_path / WORKFLOW_FILE
+    write_text(workflow_file, truncate_after(read_text(workflow_file), 'rules', 'BooleanFilter'))
+
+    counts = separate_workflows.separate_workflows(workflow_directory, sync=True)
+
+    assert counts['deleted'] == 0
+    assert list_files(tmp_path / 'Case') == before
+
+
+def test_sync_removes_deleted_rules_from_index(tmp_path):
+    index_file = str(tmp_path / 'index.json')
+    workflow_directory = separate_golden_workflows(tmp_path, index_file=index_file)
+    assert 'Case.BooleanFilter' in read_index(index_file)['WorkflowRule']
+    workflow_file = tmp_path / WORKFLOW_FILE
+    write_text(workflow_file, remove_element(read_text(workflow_file), 'rules', 'BooleanFilter'))
+
+    separate_workflows.separate_workflows(workflow_directory, sync=True, index_file=index_file)
+
+    rules = read_index(index_file)['WorkflowRule']
+    assert 'Case.BooleanFilter' not in rules and 'Case.IsChangedFunctionRule' in rules
+
+
+def test_sync_keeps_objects_without_workflow_file(tmp_path):
+    index_file = str(tmp_path / 'index.json')
+    workflow_directory = separate_golden_workflows(tmp_path, ('Account', 'Case'), index_file)
+    account_files = list_files(tmp_path / 'Account')
+    # Only the workflows of Case were retrieved
+    os.remove(tmp_path / 'Account.workflow-meta.xml')
+
+    counts = separate_workflows.separate_workflows(workflow_directory, sync=True, index_file=index_file)
+
+    assert counts['deleted'] == 0
+    assert list_files(tmp_path / 'Account') == account_files
+    assert 'Account.BooleanFilter' in read_index(index_file)['WorkflowRule']
+
+
+def test_prune_missing_objects_deletes_objects_without_workflow_file(tmp_path):
+    index_file = str(tmp_path / 'index.json')
+    workflow_directory = separate_golden_workflows(tmp_path, ('Account', 'Case'), index_file)
+    account_files = list_files(tmp_path / 'Account')
+    os.remove(tmp_path / 'Account.workflow-meta.xml')
+
+    counts = separate_workflows.separate_workflows(workflow_directory, sync=True, index_file=index_file,
+                                                   prune_missing_objects=True)
+
+    assert counts['deleted'] == len(account_files)
+    assert not (tmp_path / 'Account').exists()
+    assert not any(full_name.startswith('Account.') for members in read_index(index_file).values()
+                   for full_name in members)
+
+
+def separate_sharing_rules(tmp_path, objects=('Account',)):
+    """Separate sharing rules files for each object in a temporary source folder and return its folder."""
+    directory = tmp_path / metadata_registry.SHARING_RULES.name
+    directory.mkdir()
+    for parent_name in objects:
+        write_text(directory / metadata_registry.SHARING_RULES.combined_filename(parent_name), SHARING_RULES)
+    metadata_engine.decompose(str(tmp_path), [metadata_registry.SHARING_RULES.name])
+    return directory
+
+
+def test_engine_sync_deletes_removed_rule(tmp_path):
+    directory = separate_sharing_rules(tmp_path)
+    combined_file = directory / 'Account.sharingRules-meta.xml'
+    write_text(combined_file, remove_element(read_text(combined_file), 'sharingOwnerRules', 'Managers'))
+
+    type_counts = metadata_engine.decompose(str(tmp_path), [metadata_registry.SHARING_RULES.name], sync=True)
+
+    assert type_counts['sharingRules']['deleted'] == 1
+    assert not (directory / 'Account' / 'sharingOwnerRules').exists()
+    assert (directory / 'Account' / 'sharingCriteriaRules' / 'Partners.sharingCriteriaRules-meta.xml').exists()
+
+
+def test_engine_sync_with_parse_error_deletes_nothing(tmp_path):
+    directory = separate_sharing_rules(tmp_path)
+    before = list_files(directory / 'Account')
+    combined_file = directory / 'Account.sharingRules-meta.xml'
+    write_text(combined_file, truncate_after(read_text(combined_file), 'sharingCriteriaRules', 'Partners'))
+
+    type_counts = metadata_engine.decompose(str(tmp_path), [metadata_registry.SHARING_RULES.name], sync=True)
+
+    assert type_counts['sharingRules']['deleted'] == 0
+    assert list_files(directory / 'Account') == before
+
+
+def test_engine_prune_missing_objects_is_opt_in(tmp_path):
+    directory = separate_sharing_rules(tmp_path, ('Account', 'Lead'))
+    os.remove(directory / 'Lead.sharingRules-meta.xml')
+
+    metadata_engine.decompose(str(tmp_path), [metadata_registry.SHARING_RULES.name], sync=True)
+    assert (directory / 'Lead').exists()
+
+    metadata_engine.decompose(str(tmp_path), [metadata_registry.SHARING_RULES.name], sync=True,
+                              prune_missing_objects=True)
+    assert not (directory / 'Lead').exists()
+    assert (directory / 'Account').exists()
@@ -0,0 +1,350 @@
+import argparse
+import ctypes
+import ctypes.util
+import logging
+import os
+import select
+import struct
+import sys
+import time
+
+import combine_labels
+import combine_workflows
+import metadata_engine
+import metadata_registry
+import metrics
+import parse_package
+import xml_backend
+import xml_writer
+
+METADATA_TYPES = ['labels', 'workflows']
+
+# inotify event masks from <sys/inotify.h>
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+WATCH_MASK = IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_DELETE_SELF
+EVENT_HEADER = struct.Struct('iIII')
+
+
+def parse_args():
+    """Function to parse command line arguments."""
+    parser = argparse.ArgumentParser(description='A script to combine the labels and workflows again whenever '
+                                                 'their separated files change.')
+    parser.add_argument('-t', '--types', nargs='+', choices=METADATA_TYPES, default=METADATA_TYPES)
+    parser.add_argument('-f', '--file', default=parse_package.LABEL_FILE)
+    parser.add_argument('-l', '--label-directory', default=parse_package.LABEL_DIRECTORY)
+    parser.add_argument('-d', '--workflow-directory', default=parse_package.WORKFLOW_DIRECTORY)
+    parser.add_argument('-p', '--poll', default=False, action='store_true',
+                        help='Poll the directories for changes even if inotify is available.')
+    parser.add_argument('--interval', type=float, default=1.0,
+                        help='Seconds between two scans of the directories when polling.')
+    parser.add_argument('--debounce', type=float, default=0.1,
+                        help='Seconds without file changes to wait for before combining.')
+    metrics.add_arguments(parser)
+    args = parser.parse_args()
+    return args
+
+
+class InotifyWatcher:
+    """Report the paths changed under directories with Linux inotify, watching new sub-directories as well."""
+
+    def __init__(self, directories):
+        libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        self._add_watch = libc.inotify_add_watch
+        self._add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        self.fd = libc.inotify_init1(os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), 'Unable to initialize inotify.')
+        self.directories = {}
+        self.overflowed = False
+        for directory in directories:
+            self.watch_tree(directory)
+
+    def watch_tree(self, directory):
+        """Watch a directory and its sub-directories and return the files already in them."""
+        file_paths = set()
+        for root, _, files in os.walk(directory):
+            watch_descriptor = self._add_watch(self.fd, os.fsencode(root), WATCH_MASK)
+            if watch_descriptor < 0:
+                logging.warning('WARNING: Unable to watch %s: %s', root, os.strerror(ctypes.get_errno()))
+                continue
+            self.directories[watch_descriptor] = root
+            file_paths.update(os.path.join(root, filename) for filename in files)
+        return file_paths
+
+    def read(self, timeout=None):
+        """Wait up to timeout seconds, or forever if None, and return the changed paths."""
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return set()
+        data = os.read(self.fd, 64 * 1024)
+        changed_paths = set()
+        offset = 0
+        while offset < len(data):
+            watch_descriptor, mask, _, name_length = EVENT_HEADER.unpack_from(data, offset)
+            offset += EVENT_HEADER.size
+            name = os.fsdecode(data[offset:offset + name_length].rstrip(b'\0'))
+            offset += name_length
+            if mask & IN_Q_OVERFLOW:
+                self.overflowed = True
+                continue
+            directory = self.directories.get(watch_descriptor)
+            if mask & IN_IGNORED:
+                self.directories.pop(watch_descriptor, None)
+            if directory is None:
+                continue
+            path = os.path.join(directory, name) if name else directory
+            changed_paths.add(path)
+            if mask & IN_ISDIR and mask & (IN_CREATE | IN_MOVED_TO) and os.path.isdir(path):
+                # Files can be added to a new directory before it is watched
+                changed_paths.update(self.watch_tree(path))
+        return changed_paths
+
+    def close(self):
+        """Stop watching."""
+        os.close(self.fd)
+
+
+class PollingWatcher:
+    """Report the paths changed under directories by comparing their modification time and size."""
+
+    def __init__(self, directories, interval):
+        self.directories = directories
+        self.interval = interval
+        self.overflowed = False
+        self.files = self.scan()
+
+    def scan(self):
+        """Return the modification time and size of every file under the directories."""
+        files = {}
+        for directory in self.directories:
+            for root, _, filenames in os.walk(directory):
+                for filename in filenames:
+                    file_path = os.path.join(root, filename)
+                    try:
+                        stat = os.stat(file_path)
+                    except FileNotFoundError:
+                        continue
+                    files[file_path] = (stat.st_mtime_ns, stat.st_size)
+        return files
+
+    def read(self, timeout=None):
+        """Scan the directories until files change or timeout seconds pass, and return the changed paths."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            delay = self.interval if deadline is None else min(self.interval, max(deadline - time.monotonic(), 0))
+            time.sleep(delay)
+            files = self.scan()
+            changed_paths = {path for path in files.keys() | self.files.keys()
+                             if files.get(path) != self.files.get(path)}
+            self.files = files
+            if changed_paths or (deadline is not None and time.monotonic() >= deadline):
+                return changed_paths
+
+    def close(self):
+        """Stop watching."""
+
+
+def create_watcher(directories, poll=False, interval=1.0):
+    """Return an inotify watcher on Linux, or a polling watcher if inotify is not available or poll is set."""
+    if not poll and sys.platform.startswith('linux'):
+        try:
+            return InotifyWatcher(directories)
+        except (OSError, AttributeError) as error:
+            logging.warning('WARNING: inotify is not available (%s), polling the directories instead.', error)
+    return PollingWatcher(directories, interval)
+
+
+def collect_changes(watcher, debounce):
+    """Wait for changed paths, then keep collecting them until no file changed for debounce seconds."""
+    changed_paths = watcher.read()
+    while True:
+        more_paths = watcher.read(debounce)
+        if not more_paths:
+            return changed_paths
+        changed_paths |= more_paths
+
+
+class DecomposedTree:
+    """Formatted fragments of the separated labels and workflows, combined again when their files change.
+
+    Fragments are kept by path and only re-formatted when an event reports their file, so a change only
+    costs a listing of the affected folder and the parsing of the changed files.
+    """
+
+    def __init__(self, label_directory, label_file, workflow_directory, types=METADATA_TYPES):
+        self.label_directory = os.path.normpath(label_directory)
+        self.label_file = label_file
+        self.workflow_directory = os.path.normpath(workflow_directory)
+        self.types = types
+        self.labels = {}
+        # Fragments of each object keyed by path, as (workflow type, fragment)
+        self.workflows = {}
+
+    def directories(self):
+        """Return the directories to watch."""
+        directories = []
+        if 'labels' in self.types:
+            directories.append(self.label_directory)
+        if 'workflows' in self.types:
+            directories.append(self.workflow_directory)
+        return directories
+
+    def compose_all(self):
+        """Combine the labels and every workflow, reusing the fragments that are still valid."""
+        if 'labels' in self.types:
+            compose_safely(self.compose_labels)
+        if 'workflows' in self.types:
+            objects = {entry for entry in os.listdir(self.workflow_directory)
+                       if os.path.isdir(os.path.join(self.workflow_directory, entry))}
+            objects.update(self.workflows)
+            for parent_workflow_name in sorted(objects):
+                compose_safely(self.compose_workflow, parent_workflow_name)
+
+    def invalidate(self, changed_paths):
+        """Drop the fragments of the changed paths and return whether labels and which objects are affected."""
+        labels_changed = False
+        objects = set()
+        for path in changed_paths:
+            path = os.path.normpath(path)
+            directory, filename = os.path.split(path)
+            if 'labels' in self.types and directory == self.label_directory:
+                if filename.endswith('.xml') and not filename.endswith('.labels-meta.xml'):
+                    self.labels.pop(path, None)
+                    labels_changed = True
+                continue
+            if 'workflows' not in self.types:
+                continue
+            relative_path = os.path.relpath(path, self.workflow_directory)
+            parts = relative_path.split(os.sep)
+            if parts[0] in (os.curdir, os.pardir) or (len(parts) == 1 and not os.path.isdir(path)
+                                                      and parts[0] not in self.workflows):
+                # Combined workflow files and paths outside the workflow directory
+                continue
+            parent_workflow_name = parts[0]
+            fragments = self.workflows.get(parent_workflow_name, {})
+            if len(parts) <= 2:
+                # An object or type folder was created, deleted or renamed
+                fragments.clear()
+            else:
+                fragments.pop(path, None)
+            objects.add(parent_workflow_name)
+        return labels_changed, objects
+
+    def compose_labels(self):
+        """Combine the labels file from the cached and re-formatted label fragments."""
+        label_paths = [file_path for _, file_path in combine_labels.scan_individual_xmls(self.label_directory)]
+        fragments = []
+        for label_path in label_paths:
+            fragment = self.labels.get(label_path)
+            if fragment is None:
+                fragment = metadata_engine.format_separated_file(xml_backend.parse(label_path))
+                self.labels[label_path] = fragment
+            fragments.append(fragment)
+        # Forget the deleted labels
+        if len(self.labels) != len(label_paths):
+            self.labels = {label_path: self.labels[label_path] for label_path in label_paths}
+        content = xml_writer.fragments_to_bytes(metadata_engine.create_combined_root(metadata_registry.LABELS),
+                                                fragments)
+        return write_combined_file(content, self.label_file)
+
+    def compose_workflow(self, parent_workflow_name):
+        """Combine the workflow file of an object, or delete it if the object has no separated files."""
+        object_directory = os.path.join(self.workflow_directory, parent_workflow_name)
+        workflow_filename = combine_workflows.get_workflow_filename(self.workflow_directory, parent_workflow_name)
+        file_paths = (metadata_engine.walk_separated_files(metadata_registry.WORKFLOWS, object_directory)
+                      if os.path.isdir(object_directory) else [])
+        if not file_paths:
+            self.workflows.pop(parent_workflow_name, None)
+            if os.path.isfile(workflow_filename):
+                os.remove(workflow_filename)
+                logging.info('Deleted %s', workflow_filename)
+            return False
+
+        cached_fragments = self.workflows.get(parent_workflow_name, {})
+        fragments = {}
+        for file_path in file_paths:
+            fragment = cached_fragments.get(file_path)
+            if fragment is None:
+                root = xml_backend.parse(file_path)
+                fragment = (root.tag, metadata_engine.format_separated_file(root))
+            fragments[file_path] = fragment
+        self.workflows[parent_workflow_name] = fragments
+        # Same order as metadata_engine.parse_separated_files
+        sorted_fragments = sorted(fragments.values(), key=lambda fragment: fragment[0])
+        content = xml_writer.fragments_to_bytes(metadata_engine.create_combined_root(metadata_registry.WORKFLOWS),
+                                                (fragment for _, fragment in sorted_fragments))
+        return write_combined_file(content, workflow_filename)
+
+    def update(self, changed_paths):
+        """Combine the files affected by the changed paths."""
+        labels_changed, objects = self.invalidate(changed_paths)
+        if labels_changed:
+            compose_safely(self.compose_labels)
+        for parent_workflow_name in sorted(objects):
+            compose_safely(self.compose_workflow, parent_workflow_name)
+
+
+def compose_safely(compose, *args):
+    """Combine a file, logging a warning instead of stopping if a separated file cannot be read."""
+    try:
+        compose(*args)
+    except (xml_backend.ParseError, FileNotFoundError) as error:
+        # Files saved in several steps are combined again on their next event
+        logging.warning('WARNING: Unable to combine the changed files: %s', error)
+
+
+def write_combined_file(content, output_file):
+    """Write a combined file if it changed and log it."""
+    if not xml_writer.write_bytes_if_changed(content, output_file):
+        return False
+    logging.info('Updated %s', output_file)
+    return True
+
+
+def watch(types=METADATA_TYPES, label_file=parse_package.LABEL_FILE, label_directory=parse_package.LABEL_DIRECTORY,
+          workflow_directory=parse_package.WORKFLOW_DIRECTORY, poll=False, interval=1.0, debounce=0.1):
+    """Combine the labels and workflows, then combine them again whenever their separated files change."""
+    tree = DecomposedTree(label_directory, label_file, workflow_directory, types)
+    watcher = create_watcher(tree.directories(), poll, interval)
+    tree.compose_all()
+    logging.info('Watching %s for changes with %s. Press Ctrl+C to stop.', ', '.join(tree.directories()),
+                 'polling' if isinstance(watcher, PollingWatcher) else 'inotify')
+    try:
+        while True:
+            changed_paths = collect_changes(watcher, debounce)
+            start = time.perf_counter()
+            if watcher.overflowed:
+                # Events were lost, so none of the fragments can be trusted
+                watcher.overflowed = False
+                tree.labels.clear()
+                tree.workflows.clear()
+                tree.compose_all()
+            else:
+                tree.update(changed_paths)
+            logging.debug('Combined %d changed path(s) in %.1f ms.', len(changed_paths),
+                          (time.perf_counter() - start) * 1000)
+    except KeyboardInterrupt:
+        logging.info('Stopped watching.')
+    finally:
+        watcher.close()
+
+
+def main(inputs):
+    """Main function."""
+    watch(inputs.types, inputs.file, inputs.label_directory, inputs.workflow_directory, inputs.poll,
+          inputs.interval, inputs.debounce)
+
+
+if __name__ == '__main__':
+    inputs = parse_args()
+    metrics.configure_logging(inputs)
+    main(inputs)
+    metrics.report('watch', inputs)
@@ -0,0 +1,129 @@
+"""XML parsing backend shared by the scripts.
+
+lxml is used when it is installed, otherwise the standard library ElementTree.
+Set DECOMPOSER_XML_BACKEND to 'lxml' or 'stdlib' to choose one. Both backends
+return elements with the same tag, attrib, text and tail, and every file is
+written by xml_writer, so the output does not depend on the backend.
+"""
+import os
+import xml.etree.ElementTree as ElementTree
+
+import metrics
+
+BACKEND_VARIABLE = 'DECOMPOSER_XML_BACKEND'
+BACKENDS = ['lxml', 'stdlib']
+
+
+def _load_lxml():
+    """Return the lxml etree module, or None if lxml is not installed."""
+    try:
+        from lxml import etree
+    except ImportError:
+        return None
+    return etree
+
+
+def _select_backend(requested):
+    """Return the name of the backend and the lxml module if it is used."""
+    requested = (requested or '').strip().lower()
+    if requested and requested not in BACKENDS:
+        raise ValueError(f'The XML backend must be one of {", ".join(BACKENDS)}, not {requested!r}.')
+    if requested == 'stdlib':
+        return 'stdlib', None
+    etree = _load_lxml()
+    if etree is None:
+        if requested == 'lxml':
+            raise ImportError('The lxml backend was requested, but lxml is not installed.')
+        return 'stdlib', None
+    return 'lxml', etree
+
+
+def set_backend(requested=None):
+    """Use the requested backend, or lxml if it is installed when none is requested. Return its name."""
+    global BACKEND, ParseError, _etree, _PARSER
+    BACKEND, _etree = _select_backend(requested)
+    if _etree is not None:
+        ParseError = _etree.XMLSyntaxError
+        # Drop comments and processing instructions like the standard library parser does
+        _PARSER = _etree.XMLParser(remove_comments=True, remove_pis=True)
+    else:
+        ParseError = ElementTree.ParseError
+        _PARSER = None
+    return BACKEND
+
+
+BACKEND = ParseError = _etree = _PARSER = None
+set_backend(os.environ.get(BACKEND_VARIABLE))
+
+
+def parse(source):
+    """Parse an XML file and return its root element."""
+    with metrics.phase('parse'):
+        with open(source, 'rb') as file:
+            content = file.read()
+        metrics.count('files_read')
+        metrics.count('bytes_read', len(content))
+        return _fromstring(content)
+
+
+def fromstring(content):
+    """Parse XML content and return its root element."""
+    with metrics.phase('parse'):
+        return _fromstring(content)
+
+
+def _fromstring(content):
+    """Parse XML content with the selected backend."""
+    if _etree is not None:
+        return _etree.fromstring(content, _PARSER)
+    return ElementTree.fromstring(content)
+
+
+def iterparse(source, events=('end',)):
+    """Yield (event, element) pairs while an XML file is parsed.
+
+    The caller times the iteration, which is interleaved with its own processing.
+    """
+    metrics.count('files_read')
+    metrics.count('bytes_read', os.path.getsize(source))
+    if _etree is not None:
+        return _etree.iterparse(source, events=events, remove_comments=True, remove_pis=True)
+    return ElementTree.iterparse(source, events=events)
+
+
+def iter_children(source):
+    """Yield each namespaced top-level element of an XML file as soon as it is parsed.
+
+    Each element is cleared once the caller is done with it, so memory stays flat for large files.
+    """
+    root = None
+    depth = 0
+    # Only the parsing counts for the parse phase, not the processing of the yielded elements
+    parse_phase = metrics.phase('parse').begin()
+    try:
+        for event, element in iterparse(source, events=('start', 'end')):
+            if event == 'start':
+                if root is None:
+                    root = element
+                depth += 1
+                continue
+            depth -= 1
+            if depth == 1 and '}' in element.tag:
+                parse_phase.end()
+                try:
+                    yield element
+                finally:
+                    parse_phase.begin()
+            if depth == 1:
+                # Release the processed element so memory stays flat
+                root.clear()
+    finally:
+        parse_phase.end()
+
+
+def strip_namespaces(element):
+    """Remove the namespace from the tag of an element and all of its descendants."""
+    for descendant in element.iter():
+        if '}' in descendant.tag:
+            descendant.tag = descendant.tag.split('}')[1]
+    return element
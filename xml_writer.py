@@ -0,0 +1,335 @@
+"""Shared writer for Salesforce CLI style XML files.
+
+The output matches what the scripts used to produce with
+ET.tostring -> minidom.toprettyxml(indent='    ') followed by dropping the
+blank lines and the minidom XML declaration, but it is built in a single pass
+and written straight to the file handle.
+"""
+import io
+import os
+
+import metrics
+
+XML_HEADER = '<?xml version="1.0" encoding="UTF-8"?>\n'
+INDENT = '    '
+
+# Number of formatted lines held in memory before they are flushed to the file
+CHUNK_LINES = 4096
+
+XML_NAMESPACE = 'http://www.w3.org/XML/1998/namespace'
+# Prefixes ElementTree gives to well-known namespaces, the other ones are numbered ns0, ns1, ...
+KNOWN_PREFIXES = {
+    'http://www.w3.org/1999/xhtml': 'html',
+    'http://www.w3.org/1999/02/22-rdf-syntax-ns#': 'rdf',
+    'http://schemas.xmlsoap.org/wsdl/': 'wsdl',
+    'http://www.w3.org/2001/XMLSchema': 'xs',
+    'http://www.w3.org/2001/XMLSchema-instance': 'xsi',
+    'http://purl.org/dc/elements/1.1/': 'dc',
+}
+
+
+def _escape(data):
+    """Escape character data like the minidom writer."""
+    return data.replace('&', '&amp;').replace('<', '&lt;').replace('"', '&quot;').replace('>', '&gt;')
+
+
+def _escape_text(data):
+    """Escape text, normalizing carriage returns like an XML parser would on re-read."""
+    if '\r' in data:
+        data = data.replace('\r\n', '\n').replace('\r', '\n')
+    return _escape(data)
+
+
+def _add_block(lines, block):
+    """Add a block of output, dropping any blank lines it contains."""
+    if '\n' not in block:
+        if block.strip():
+            lines.append(block)
+        return
+    lines.extend(line for line in block.split('\n') if line.strip())
+
+
+def _is_namespace_declaration(name):
+    """Return True if the attribute name declares a namespace."""
+    return name == 'xmlns' or name.startswith('xmlns:')
+
+
+def _collect_namespaces(elements, namespaces=None):
+    """Return the prefix of the namespace of every qualified attribute name of the elements and their descendants.
+
+    Prefixes are given in document order like ElementTree does, the xml prefix is never declared.
+    """
+    namespaces = {} if namespaces is None else namespaces
+    for element in elements:
+        for descendant in element.iter():
+            if not descendant.attrib:
+                continue
+            for name in descendant.attrib:
+                if name[:1] == '{':
+                    uri = name[1:].rsplit('}', 1)[0]
+                    if uri not in namespaces and uri != XML_NAMESPACE:
+                        namespaces[uri] = KNOWN_PREFIXES.get(uri, f'ns{len(namespaces)}')
+    return namespaces
+
+
+def _declare_namespaces(namespaces):
+    """Return the namespace declarations of the prefixes, sorted by prefix."""
+    return ''.join(f' xmlns:{prefix}="{_escape(uri)}"'
+                   for uri, prefix in sorted(namespaces.items(), key=lambda item: item[1]))
+
+
+class _NamespacesNeeded(Exception):
+    """Raised when a qualified attribute name is formatted before the namespaces were collected."""
+
+
+def _qualified_name(name, namespaces):
+    """Return the prefixed name of a qualified attribute name like {uri}name."""
+    uri, local_name = name[1:].rsplit('}', 1)
+    if uri == XML_NAMESPACE:
+        return f'xml:{local_name}'
+    if namespaces is None:
+        raise _NamespacesNeeded
+    prefix = namespaces[uri]
+    return f'{prefix}:{local_name}'
+
+
+def _start_tag(element, namespaces=None):
+    """Return the opening tag of an element without the closing bracket."""
+    tag = '<' + element.tag
+    attributes = element.attrib.items()
+    if len(attributes) > 1:
+        # Namespace declarations are written before the other attributes
+        attributes = sorted(attributes, key=lambda item: not _is_namespace_declaration(item[0]))
+    for name, value in attributes:
+        if name[:1] == '{':
+            name = _qualified_name(name, namespaces)
+        tag += f' {name}="{_escape(value)}"'
+    return tag
+
+
+def _format(element, indent, lines, start=None, text=None, namespaces=None):
+    """Append the formatted lines of an element."""
+    if start is None:
+        start = indent + _start_tag(element, namespaces)
+        text = element.text
+    if not len(element):
+        if text:
+            _add_block(lines, f'{start}>{_escape_text(text)}</{element.tag}>')
+        else:
+            _add_block(lines, start + '/>')
+        return
+
+    _add_block(lines, start + '>')
+    child_indent = indent + INDENT
+    if text and text.strip():
+        _add_block(lines, child_indent + _escape_text(text))
+    for child in element:
+        _format(child, child_indent, lines, namespaces=namespaces)
+        tail = child.tail
+        if tail and tail.strip():
+            _add_block(lines, child_indent + _escape_text(tail))
+    lines.append(f'{indent}</{element.tag}>')
+
+
+def _root_start_tag(element, namespaces):
+    """Return the opening tag of a root element, declaring the namespaces of the attributes below it."""
+    start_tag = _start_tag(element, namespaces)
+    if not namespaces:
+        return start_tag
+    tag = '<' + element.tag
+    return tag + _declare_namespaces(namespaces) + start_tag[len(tag):]
+
+
+def format_element(element, indent=''):
+    """Return the formatted lines of an element at the given indentation.
+
+    The element declares the namespaces of the qualified attribute names below it.
+    """
+    with metrics.phase('serialize'):
+        try:
+            return _format_element(element, indent, None)
+        except _NamespacesNeeded:
+            return _format_element(element, indent, _collect_namespaces([element]))
+
+
+def _format_element(element, indent, namespaces):
+    """Return the formatted lines of an element declaring the namespaces."""
+    lines = []
+    _format(element, indent, lines, indent + _root_start_tag(element, namespaces), element.text, namespaces)
+    return lines
+
+
+def format_merged_element(element, indent=''):
+    """Return the formatted lines of a new element with the tag and children of an element.
+
+    The attributes and text of the element itself are left out, like when its children are moved into
+    an empty element with the same tag. As fragments are written after the root element, the element declares
+    the namespaces of the qualified attribute names below it instead of the root.
+    """
+    with metrics.phase('serialize'):
+        try:
+            return _format_merged_element(element, indent, None)
+        except _NamespacesNeeded:
+            return _format_merged_element(element, indent, _collect_namespaces(element))
+
+
+def _format_merged_element(element, indent, namespaces):
+    """Return the formatted lines of a merged element declaring the namespaces."""
+    lines = []
+    start = f'{indent}<{element.tag}{_declare_namespaces(namespaces)}' if namespaces else f'{indent}<{element.tag}'
+    _format(element, indent, lines, start, namespaces=namespaces)
+    return lines
+
+
+def write_xml(root, stream):
+    """Write the XML header and the formatted root element to a text stream."""
+    stream.write(XML_HEADER)
+    if not len(root):
+        stream.write('\n'.join(format_element(root)))
+        return
+    try:
+        _write_root(root, stream, None)
+    except _NamespacesNeeded:
+        _write_root(root, stream, _collect_namespaces([root]))
+
+
+def _write_root(root, stream, namespaces):
+    """Write the formatted root element with children to a text stream.
+
+    Without namespaces, _NamespacesNeeded is raised before anything is written if an attribute name is qualified.
+    """
+    lines = []
+    _add_block(lines, _root_start_tag(root, namespaces) + '>')
+    if root.text and root.text.strip():
+        _add_block(lines, INDENT + _escape_text(root.text))
+    written = False
+    for child in root:
+        _format(child, INDENT, lines, namespaces=namespaces)
+        tail = child.tail
+        if tail and tail.strip():
+            _add_block(lines, INDENT + _escape_text(tail))
+        if len(lines) >= CHUNK_LINES:
+            if namespaces is None:
+                # The root element is about to be written, so the rest of the tree is checked now
+                namespaces = _collect_namespaces([root])
+                if namespaces:
+                    raise _NamespacesNeeded
+            written = _flush(stream, lines, written)
+    lines.append(f'</{root.tag}>')
+    _flush(stream, lines, written)
+
+
+def _flush(stream, lines, written):
+    """Write the pending lines to the stream and clear them."""
+    if lines:
+        if written:
+            stream.write('\n')
+        stream.write('\n'.join(lines))
+        lines.clear()
+        written = True
+    return written
+
+
+def write_xml_fragments(root, fragments, stream):
+    """Write the XML header and the root element around children formatted with format_element.
+
+    The root element's own children are ignored, each fragment is the joined lines of one child.
+    Fragments can be generated while they are written.
+    """
+    fragments = iter(fragments)
+    first_fragment = next(fragments, None)
+    if first_fragment is None:
+        write_xml(root, stream)
+        return
+    start_lines = []
+    _add_block(start_lines, _start_tag(root) + '>')
+    stream.write(XML_HEADER)
+    stream.write('\n'.join(start_lines))
+    stream.write('\n')
+    stream.write(first_fragment)
+    for fragment in fragments:
+        stream.write('\n')
+        stream.write(fragment)
+    stream.write(f'\n</{root.tag}>')
+
+
+def _count_written(output_file):
+    """Count a file written and its size."""
+    metrics.count('files_written')
+    metrics.count('bytes_written', os.path.getsize(output_file))
+
+
+def write_xml_file(root, output_file):
+    """Write the formatted root element to a file."""
+    with metrics.phase('write'):
+        with open(output_file, 'w', encoding='utf-8', newline='') as file:
+            write_xml(root, file)
+        _count_written(output_file)
+
+
+def xml_to_bytes(root):
+    """Return the formatted root element as UTF-8 encoded bytes."""
+    with metrics.phase('serialize'):
+        stream = io.StringIO()
+        write_xml(root, stream)
+        return stream.getvalue().encode('utf-8')
+
+
+def fragments_to_bytes(root, fragments):
+    """Return the root element around the formatted fragments as UTF-8 encoded bytes."""
+    with metrics.phase('serialize'):
+        stream = io.StringIO()
+        write_xml_fragments(root, fragments, stream)
+        return stream.getvalue().encode('utf-8')
+
+
+def write_xml_fragments_file(root, fragments, output_file):
+    """Write the root element around the formatted fragments to a file.
+
+    Fragments generated while they are written are timed in their own phases.
+    """
+    with metrics.phase('write'):
+        with open(output_file, 'w', encoding='utf-8', newline='') as file:
+            write_xml_fragments(root, fragments, file)
+        _count_written(output_file)
+
+
+def write_bytes_if_changed(content, output_file):
+    """Write the content to a file unless the file already holds the same bytes.
+
+    The size is compared before the contents, and changed files are replaced atomically through a temporary
+    file in the same directory. Return True if the file was written.
+    """
+    with metrics.phase('write'):
+        return _write_bytes_if_changed(content, output_file)
+
+
+def _write_bytes_if_changed(content, output_file):
+    """Write the content to a file unless it is unchanged and count the file."""
+    try:
+        if os.path.getsize(output_file) == len(content):
+            with open(output_file, 'rb') as file:
+                if file.read() == content:
+                    metrics.count('files_unchanged')
+                    return False
+    except FileNotFoundError:
+        pass
+
+    directory, filename = os.path.split(output_file)
+    temp_file = os.path.join(directory, f'.{filename}.{os.getpid()}.tmp')
+    try:
+        with open(temp_file, 'wb') as file:
+            file.write(content)
+        os.replace(temp_file, output_file)
+    except BaseException:
+        if os.path.exists(temp_file):
+            os.remove(temp_file)
+        raise
+    metrics.count('files_written')
+    metrics.count('bytes_written', len(content))
+    return True
+
+
+def write_xml_file_if_changed(root, output_file):
+    """Write the formatted root element to a file unless it is unchanged. Return True if it was written."""
+    return write_bytes_if_changed(xml_to_bytes(root), output_file)